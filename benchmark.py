@@ -0,0 +1,714 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from earthquakes import QUAKE_DTYPE, QuakeData, calc_distance, get_quake_row, make_quakes, validate_features
+from output import iter_batches, to_quake_array, write_geojson
+from quake_cache import load_quake_data
+from quake_export import export_quakes, write_quake_lines
+from quake_spatial import SpatialIndex, calc_distances
+
+
+def make_geojson(size, seed=0):
+    """This function is responsible for building a synthetic geojson dict with the given number of features,
+        shaped like the features that output.py writes"""
+
+    rng = np.random.default_rng(seed)
+
+    mags = np.round(rng.uniform(0, 10, size), 2)
+    felt = rng.integers(0, 10000, size)
+    sig = rng.integers(1, 5000, size)
+    lats = rng.uniform(-90, 90, size)
+    longs = rng.uniform(-180, 180, size)
+
+    features = []
+    for i in range(size):
+        features.append({
+            'type': 'Feature',
+            'properties': {
+                'mag': float(mags[i]),
+                'time': 1715221312431 + i,
+                'felt': int(felt[i]),
+                'sig': int(sig[i]),
+                'type': 'earthquake'
+            },
+            'geometry': {'type': 'Point', 'coordinates': [float(lats[i]), float(longs[i]), 0.1]},
+            'id': f'syn{i}'
+        })
+
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def make_quake_array(size, seed=0):
+    """This function is responsible for building a synthetic quake array with the output.py generator, for
+        catalogs too large to build as geojson first"""
+
+    return np.concatenate([to_quake_array(batch) for batch in iter_batches(size, seed)])
+
+
+def scalar_filtered_array(qd):
+    """This function is the original per-row filter loop, kept as the reference for the vectorized path.
+        It returns the indices of the rows that pass."""
+
+    filtered_quakes = []
+    lat_f, long_f, dist_f = qd.location_filter
+    mag_f, felt_f, sig_f = qd.property_filter
+
+    for i, q in enumerate(qd.quake_array):
+        if calc_distance(q['lat'], q['long'], float(lat_f), float(long_f)) >= int(dist_f):
+            if float(q['magnitude']) >= mag_f:
+                if int(q['significance']) >= sig_f:
+                    if int(q['felt']) >= felt_f:
+                        filtered_quakes.append(i)
+
+    return filtered_quakes
+
+
+def time_call(func, repeat=3):
+    """This function is responsible for returning the best wall time of a few calls to func"""
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_filter(sizes):
+    """This function is responsible for comparing the scalar and vectorized filter paths"""
+
+    print(f"{'rows':>10} {'scalar (s)':>12} {'vector (s)':>12} {'speedup':>9} {'cached (s)':>12}")
+    for size in sizes:
+        qd = QuakeData(make_geojson(size))
+        qd.location_filter = (52.1, -106.6, 5000)
+        qd.property_filter = (3.0, 100, 500)
+
+        # make sure every path agrees before timing them
+        expected = scalar_filtered_array(qd)
+        assert expected == np.flatnonzero(qd.compute_filtered_mask()).tolist()
+        qd.build_spatial_index()
+        assert expected == np.flatnonzero(qd.compute_filtered_mask()).tolist()
+        qd.spatial_index = None
+
+        scalar = time_call(lambda: scalar_filtered_array(qd), repeat=1)
+        vector = time_call(lambda: qd.quake_array[qd.compute_filtered_mask()])
+        cached = time_call(qd.get_filtered_array)
+        print(f"{size:>10} {scalar:>12.4f} {vector:>12.4f} {scalar / vector:>8.1f}x {cached:>12.4f}")
+
+
+def bench_distance(sizes):
+    """This function is responsible for comparing per-call calc_distance with the batched calc_distances"""
+
+    print(f"{'points':>10} {'scalar (s)':>12} {'batched (s)':>12} {'reused out (s)':>15}")
+    for size in sizes:
+        rng = np.random.default_rng(size)
+        lats = rng.uniform(-90, 90, size)
+        longs = rng.uniform(-180, 180, size)
+        out = np.empty(size)
+
+        scalar = time_call(lambda: [calc_distance(lat, lon, 52.1, -106.6) for lat, lon in zip(lats, longs)], repeat=1)
+        batched = time_call(lambda: calc_distances(lats, longs, 52.1, -106.6))
+        reused = time_call(lambda: calc_distances(lats, longs, 52.1, -106.6, out=out))
+        print(f"{size:>10} {scalar:>12.4f} {batched:>12.4f} {reused:>15.4f}")
+
+
+def bench_spatial_index(sizes, radii=(50, 500, 5000)):
+    """This function is responsible for comparing indexed and brute-force radius query latency"""
+
+    print(f"{'rows':>10} {'radius km':>10} {'build (s)':>10} {'brute (ms)':>11} {'indexed (ms)':>13} {'speedup':>9}")
+    for size in sizes:
+        rng = np.random.default_rng(size)
+        lats = rng.uniform(-90, 90, size)
+        longs = rng.uniform(-180, 180, size)
+        points = list(zip(rng.uniform(-90, 90, 50), rng.uniform(-180, 180, 50)))
+
+        start = time.perf_counter()
+        index = SpatialIndex(lats, longs)
+        build = time.perf_counter() - start
+
+        for radius in radii:
+            def brute():
+                for lat, long in points:
+                    np.flatnonzero(calc_distances(lats, longs, lat, long) <= radius)
+
+            def indexed():
+                for lat, long in points:
+                    index.query_radius(lat, long, radius)
+
+            brute_ms = time_call(brute) / len(points) * 1000
+            indexed_ms = time_call(indexed) / len(points) * 1000
+            print(f"{size:>10} {radius:>10} {build:>10.4f} {brute_ms:>11.3f} {indexed_ms:>13.3f} "
+                  f"{brute_ms / indexed_ms:>8.1f}x")
+
+
+def get_peak_rss():
+    """This function is responsible for returning the peak RSS of this process in MB"""
+
+    # VmHWM starts fresh with each exec, where ru_maxrss carries over the parent's peak
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    # ru_maxrss is in KB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_and_measure(path, mode, chunk_size):
+    """This function runs in a fresh process, loading the file and returning (seconds, rows, peak RSS in MB)"""
+
+    start = time.perf_counter()
+    if mode == 'json.load':
+        with open(path, 'r') as file:
+            qd = QuakeData(json.load(file))
+    else:
+        qd = QuakeData.from_path(path, chunk_size=chunk_size)
+    seconds = time.perf_counter() - start
+
+    return seconds, len(qd.quake_array), get_peak_rss()
+
+
+def bench_ingest(sizes, chunk_sizes=(1_000, 10_000, 100_000)):
+    """This function is responsible for comparing the time and peak memory of json.load against streaming"""
+
+    # every load runs in its own process so the peak RSS of one doesn't leak into the next
+    context = multiprocessing.get_context('spawn')
+
+    print(f"{'rows':>10} {'file MB':>8} {'loader':>18} {'time (s)':>9} {'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            path = os.path.join(tmp, f'quakes_{size}.geojson')
+            write_geojson(path, size)
+            file_mb = os.path.getsize(path) / 1024 ** 2
+
+            runs = [('json.load', None)] + [('from_path', chunk_size) for chunk_size in chunk_sizes]
+            for mode, chunk_size in runs:
+                with context.Pool(1) as pool:
+                    seconds, rows, peak = pool.apply(load_and_measure, (path, mode, chunk_size))
+                label = mode if chunk_size is None else f'{mode} ({chunk_size})'
+                print(f"{rows:>10} {file_mb:>8.1f} {label:>18} {seconds:>9.3f} {peak:>12.1f}")
+
+
+class DictQuake:
+    """This class copies a Quake into a plain obj with a __dict__, the way Quakes were stored before"""
+
+    def __init__(self, quake):
+        self.mag = quake.mag
+        self.time = quake.time
+        self.felt = quake.felt
+        self.sig = quake.sig
+        self.q_type = quake.q_type
+        self.lat = quake.lat
+        self.long = quake.long
+
+
+def bench_storage(sizes):
+    """This function is responsible for comparing the bytes per event of the columnar quake array with the
+        old layout, which kept a Quake obj in an object column next to the numeric columns"""
+
+    old_dtype = [('quake', 'O'), ('magnitude', 'float64'), ('felt', 'int32'), ('significance', 'int32'),
+                 ('lat', 'float64'), ('long', 'float64')]
+
+    print(f"{'rows':>10} {'old bytes/event':>16} {'columnar bytes/event':>21}")
+    for size in sizes:
+        qa = QuakeData(make_geojson(size)).quake_array
+
+        # measure everything the old layout allocated, objects included
+        tracemalloc.start()
+        quakes = [DictQuake(quake) for quake in make_quakes(qa)]
+        old = np.array(list(zip(quakes, qa['magnitude'], qa['felt'], qa['significance'], qa['lat'], qa['long'])),
+                       dtype=old_dtype)
+        old_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del old, quakes
+
+        print(f"{size:>10} {old_bytes / size:>16.1f} {qa.nbytes / size:>21.1f}")
+
+
+def bench_cache(sizes):
+    """This function is responsible for comparing a cold start (parse and save the cache) with a warm start
+        (memory-map the cache) of load_quake_data"""
+
+    print(f"{'rows':>10} {'cold (s)':>10} {'warm (s)':>10} {'speedup':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            path = os.path.join(tmp, f'quakes_{size}.geojson')
+            write_geojson(path, size)
+            cache_dir = os.path.join(tmp, f'cache_{size}')
+
+            cold = time_call(lambda: load_quake_data(path, cache_dir), repeat=1)
+            warm = time_call(lambda: load_quake_data(path, cache_dir))
+
+            print(f"{size:>10} {cold:>10.3f} {warm:>10.4f} {cold / warm:>8.0f}x")
+
+
+def bench_sharded(sizes, files=16, workers=(1, 2, 4, 8)):
+    """This function is responsible for measuring how loading many files with QuakeData.from_paths scales with
+        the number of worker processes. Each size is split evenly across the files."""
+
+    print(f"cpus available: {os.cpu_count()}")
+    print(f"{'rows':>10} {'files':>6} {'workers':>8} {'time (s)':>9} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            paths = []
+            for i in range(files):
+                paths.append(os.path.join(tmp, f'quakes_{size}_{i:03}.geojson'))
+                write_geojson(paths[-1], size // files, seed=i)
+
+            base = None
+            for count in workers:
+                seconds = time_call(lambda: QuakeData.from_paths(paths, workers=count), repeat=1)
+                base = seconds if base is None else base
+                print(f"{size:>10} {files:>6} {count:>8} {seconds:>9.3f} {base / seconds:>7.2f}x")
+
+
+def scalar_magnitude_stats(qd):
+    """This function is the original list based magnitude stats, kept as the reference for the stats engine"""
+
+    magnitudes = [q.mag for q in make_quakes(qd.get_filtered_array())]
+    vals, counts = np.unique([math.floor(mag) for mag in magnitudes], return_counts=True)
+
+    return {'count': len(magnitudes), 'mean': np.mean(magnitudes), 'median': np.median(magnitudes),
+            'std_dev': np.std(magnitudes), 'mode': vals[np.argmax(counts)]}
+
+
+def bench_stats(sizes):
+    """This function is responsible for comparing the original magnitude stats with the stats engine, both
+        for the whole catalog and with a property filter set"""
+
+    print(f"{'rows':>10} {'filtered':>9} {'scalar (s)':>11} {'build (s)':>10} {'first (ms)':>11} "
+          f"{'repeat (ms)':>12}")
+    for size in sizes:
+        qd = QuakeData.from_array(make_quake_array(size))
+        # the default filters keep every synthetic quake
+        for property_filter in [(0.0, 0, 0), (3.0, 0, 1000)]:
+            qd.property_filter = property_filter
+            qd.get_filtered_mask()
+
+            scalar = time_call(lambda: scalar_magnitude_stats(qd), repeat=1)
+            build = time_call(qd.build_magnitude_stats, repeat=1)
+            # the first call merges the sort and works out the stats for these filters
+            first = time_call(qd.get_magnitude_stats, repeat=1) * 1000
+            repeat = time_call(qd.get_magnitude_stats) * 1000
+
+            expected = scalar_magnitude_stats(qd)
+            actual = qd.get_magnitude_stats()
+            for key in expected:
+                assert math.isclose(expected[key], actual[key], rel_tol=1e-9), key
+
+            filtered = property_filter != (0.0, 0, 0)
+            print(f"{size:>10} {str(filtered):>9} {scalar:>11.3f} {build:>10.3f} {first:>11.3f} {repeat:>12.4f}")
+
+
+def bench_upsert(sizes, changes=100):
+    """This function is responsible for comparing applying a feed refresh of a few changed quakes with upsert
+        against rebuilding the QuakeData obj and its index and stats from scratch"""
+
+    print(f"{'rows':>10} {'changes':>8} {'rebuild (s)':>12} {'first upsert (s)':>17} {'next upsert (s)':>16} "
+          f"{'speedup':>9}")
+    for size in sizes:
+        catalog = make_quake_array(size)
+
+        # half the changes are updated quakes, half are new ones
+        refresh = catalog[:changes].copy()
+        refresh['magnitude'][:changes // 2] += 1
+        refresh['id'][changes // 2:] = [f'new{i}'.encode() for i in range(changes - changes // 2)]
+
+        def rebuild():
+            qd = QuakeData.from_array(np.concatenate((catalog, refresh[changes // 2:])))
+            qd.build_spatial_index()
+            qd.build_magnitude_stats()
+            qd.get_magnitude_stats()
+
+        qd = QuakeData.from_array(catalog.copy())
+        qd.build_spatial_index()
+        qd.build_magnitude_stats()
+        qd.get_magnitude_stats()
+        qd.get_id_index()
+
+        def upsert():
+            qd.upsert(refresh)
+            qd.get_magnitude_stats()
+
+        rebuilt = time_call(rebuild, repeat=1)
+        # the first upsert has to copy the catalog into a buffer with room to grow, later ones don't
+        first = time_call(upsert, repeat=1)
+        refresh['magnitude'] += 0.5
+        refresh['id'][changes // 2:] = [f'newer{i}'.encode() for i in range(changes - changes // 2)]
+        steady = time_call(upsert, repeat=1)
+        print(f"{size:>10} {changes:>8} {rebuilt:>12.4f} {first:>17.4f} {steady:>16.4f} {rebuilt / steady:>8.1f}x")
+
+
+def bench_time(sizes, fractions=(0.001, 0.01, 0.1)):
+    """This function is responsible for comparing a time window lookup in the time index against scanning the
+        time column, for windows holding different fractions of the catalog"""
+
+    print(f"{'rows':>10} {'window':>8} {'matches':>9} {'build (s)':>10} {'scan (ms)':>10} {'index (ms)':>11} "
+          f"{'speedup':>9}")
+    for size in sizes:
+        qd = QuakeData.from_array(make_quake_array(size))
+        times = qd.quake_array['time']
+        build = time_call(qd.build_time_index, repeat=1)
+
+        for fraction in fractions:
+            # a window in the middle of the catalog
+            start = int(np.quantile(times, 0.5))
+            end = int(np.quantile(times, min(0.5 + fraction, 1.0)))
+
+            def scan():
+                found = qd.quake_array[(times >= start) & (times < end)]
+                return found[np.argsort(found['time'], kind='stable')]
+
+            expected = scan()
+            actual = qd.get_time_window(start, end)
+            assert np.array_equal(np.sort(expected['time']), actual['time'])
+
+            scanned = time_call(scan) * 1000
+            indexed = time_call(lambda: qd.get_time_window(start, end)) * 1000
+            print(f"{size:>10} {fraction:>8.3f} {len(actual):>9} {build:>10.3f} {scanned:>10.3f} {indexed:>11.3f} "
+                  f"{scanned / indexed:>8.1f}x")
+
+
+def bench_property_index(sizes, selectivities=(0.0001, 0.001, 0.01, 0.05, 0.1, 0.5)):
+    """This function is responsible for comparing property filters that go through the sorted indexes against
+        full scans of the columns, for magnitude thresholds keeping different fractions of the catalog, then
+        with a felt threshold on top"""
+
+    print(f"{'rows':>10} {'kept':>8} {'felt':>6} {'matches':>9} {'scan (ms)':>10} {'index (ms)':>11} "
+          f"{'speedup':>9}")
+    for size in sizes:
+        qd = QuakeData.from_array(make_quake_array(size))
+        qd.build_property_indexes()
+        mags = qd.quake_array['magnitude']
+
+        for selectivity in selectivities:
+            for felt in (0, 5000):
+                qd.property_filter = (float(np.quantile(mags, 1 - selectivity)), felt, 0)
+
+                # always use the indexes, to see where they stop paying off
+                qd.index_max_fraction = 1.0
+                indexed_mask = qd.compute_filtered_mask()
+                indexed = time_call(qd.compute_filtered_mask) * 1000
+
+                qd.index_max_fraction = 0.0
+                assert np.array_equal(indexed_mask, qd.compute_filtered_mask())
+                scanned = time_call(qd.compute_filtered_mask) * 1000
+
+                print(f"{size:>10} {selectivity:>8.4f} {felt:>6} {int(np.count_nonzero(indexed_mask)):>9} "
+                      f"{scanned:>10.3f} {indexed:>11.3f} {scanned / indexed:>8.1f}x")
+
+
+def bench_validate(sizes):
+    """This function is responsible for comparing validating the features of a geojson one at a time against
+        validating them all at once with validate_features"""
+
+    print(f"{'rows':>10} {'per feature (s)':>16} {'batch (s)':>10} {'speedup':>9}")
+    for size in sizes:
+        features = make_geojson(size)['features']
+
+        def per_feature():
+            rows = [get_quake_row(feature) for feature in features]
+            return np.array([row for row in rows if row is not None], dtype=QUAKE_DTYPE)
+
+        assert per_feature().tobytes() == validate_features(features)[0].tobytes()
+
+        scalar = time_call(per_feature, repeat=1)
+        batch = time_call(lambda: validate_features(features), repeat=1)
+        print(f"{size:>10} {scalar:>16.3f} {batch:>10.3f} {scalar / batch:>8.1f}x")
+
+
+def bench_parallel(sizes, workers=(1, 2, 4, 8)):
+    """This function is responsible for measuring how evaluating the filters in blocks across a pool of threads
+        scales with the number of threads, for a property filter and for a location filter"""
+
+    print(f"cpus: {os.cpu_count()}")
+    print(f"{'rows':>10} {'filter':>9} {'workers':>8} {'seconds':>9} {'speedup':>9}")
+    filters = {'property': ((0.0, 0.0, 0), (5.0, 1000, 1000)), 'location': ((52.1, -106.6, 5000), (0.0, 0, 0))}
+
+    for size in sizes:
+        qd = QuakeData.from_array(make_quake_array(size))
+
+        for name, (location_filter, property_filter) in filters.items():
+            qd.location_filter, qd.property_filter = location_filter, property_filter
+            qd.set_filter_workers(1)
+            expected = qd.compute_filtered_mask()
+
+            serial = None
+            for count in workers:
+                qd.set_filter_workers(count)
+                assert np.array_equal(expected, qd.compute_filtered_mask())
+
+                seconds = time_call(qd.compute_filtered_mask)
+                serial = seconds if serial is None else serial
+                print(f"{size:>10} {name:>9} {count:>8} {seconds:>9.4f} {serial / seconds:>8.2f}x")
+
+        qd.set_filter_workers(1)
+
+
+def make_clustered_array(size, seed=0, hotspots=500, background=0.3, spread=0.3):
+    """This function is responsible for building a synthetic quake array where most quakes are spread around a
+        number of hotspots (normally, spread degrees across) and the rest are scattered over the whole globe"""
+
+    rng = np.random.default_rng(seed)
+    quake_array = make_quake_array(size, seed)
+
+    centre_lats = np.degrees(np.arcsin(rng.uniform(-1, 1, hotspots)))
+    centre_longs = rng.uniform(-180, 180, hotspots)
+    hotspot = rng.integers(0, hotspots, size)
+    lats = np.clip(centre_lats[hotspot] + rng.normal(0, spread, size), -90, 90)
+    longs = (centre_longs[hotspot] + rng.normal(0, spread, size) + 180) % 360 - 180
+
+    scattered = rng.random(size) < background
+    lats[scattered] = np.degrees(np.arcsin(rng.uniform(-1, 1, int(scattered.sum()))))
+    longs[scattered] = rng.uniform(-180, 180, int(scattered.sum()))
+
+    quake_array['lat'] = lats
+    quake_array['long'] = longs
+    return quake_array
+
+
+def bench_cluster(sizes, settings=((10, 5), (25, 10))):
+    """This function is responsible for measuring how long finding the hotspots takes on catalogs of clustered
+        quakes, to show it grows close to linearly with the number of quakes rather than with its square"""
+
+    print(f"{'rows':>10} {'eps (km)':>9} {'min':>5} {'clusters':>9} {'noise':>9} {'seconds':>9} {'us/quake':>9}")
+    for size in sizes:
+        qd = QuakeData.from_array(make_clustered_array(size))
+
+        for eps, min_samples in settings:
+            labels, summaries = qd.find_clusters(eps, min_samples)
+            seconds = time_call(lambda: qd.find_clusters(eps, min_samples), repeat=1)
+            print(f"{size:>10} {eps:>9} {min_samples:>5} {len(summaries):>9} {int((labels < 0).sum()):>9} "
+                  f"{seconds:>9.3f} {seconds / size * 1e6:>9.2f}")
+
+
+def bench_nearest(sizes, queries=10000, ks=(1, 10), magnitudes=(0.0, 5.0)):
+    """This function is responsible for measuring batches of k nearest quake queries, with and without a
+        magnitude filter, against checking the distance to every quake for a few of the points"""
+
+    print(f"{'rows':>10} {'mag':>5} {'k':>4} {'build (s)':>10} {'us/query':>9} {'scan us/query':>14} {'speedup':>9}")
+    for size in sizes:
+        qd = QuakeData.from_array(make_clustered_array(size))
+        rng = np.random.default_rng(1)
+        lats = rng.uniform(-90, 90, queries)
+        longs = rng.uniform(-180, 180, queries)
+
+        for magnitude in magnitudes:
+            qd.property_filter = (magnitude, 0, 0)
+            build = time_call(qd.build_nearest_grid, repeat=1)
+            mask = qd.get_filtered_mask()
+
+            for k in ks:
+                rows, distances = qd.find_nearest(lats, longs, k)
+                per_query = time_call(lambda: qd.find_nearest(lats, longs, k)) / queries * 1e6
+
+                # the same answer from the distance to every filtered quake, for the first few points
+                def scan():
+                    for point in range(10):
+                        np.sort(calc_distances(qd.quake_array['lat'][mask], qd.quake_array['long'][mask],
+                                               lats[point], longs[point]))[:k]
+
+                assert np.allclose(distances[0], np.sort(calc_distances(
+                    qd.quake_array['lat'][mask], qd.quake_array['long'][mask], lats[0], longs[0]))[:k])
+                scanned = time_call(scan) / 10 * 1e6
+
+                print(f"{size:>10} {magnitude:>5} {k:>4} {build:>10.3f} {per_query:>9.2f} {scanned:>14.1f} "
+                      f"{scanned / per_query:>8.0f}x")
+
+
+def bench_export(sizes):
+    """This function is responsible for comparing printing the filtered quakes one Quake obj at a time against
+        writing them in chunks, and against exporting them as csv"""
+
+    print(f"{'rows':>10} {'print (s)':>10} {'chunked (s)':>12} {'speedup':>9} {'csv (s)':>9} {'csv MB/s':>9}")
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull:
+        path = os.path.join(tmp, 'quakes.csv')
+        for size in sizes:
+            qd = QuakeData.from_array(make_quake_array(size))
+
+            def print_quakes():
+                for quake in qd.get_filtered_list():
+                    print(quake, file=devnull)
+
+            printed = time_call(print_quakes, repeat=1)
+            chunked = time_call(lambda: write_quake_lines(qd.get_filtered_array(), devnull), repeat=1)
+            exported = time_call(lambda: export_quakes(qd, path), repeat=1)
+            megabytes = os.path.getsize(path) / 1e6
+
+            print(f"{size:>10} {printed:>10.3f} {chunked:>12.3f} {printed / chunked:>8.1f}x {exported:>9.3f} "
+                  f"{megabytes / exported:>9.1f}")
+
+
+def run_suite(sizes, repeat=3, seed=0):
+    """
+        This function is responsible for running the standard benchmark suite on reproducible synthetic catalogs
+        (same seed, same catalog) of each size, and returning the results as a dict that can be saved as json.
+        Every measurement is the best of repeat runs, in seconds, except the peak RSS which is in MB.
+    """
+
+    results = {}
+    context = multiprocessing.get_context('spawn')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            path = os.path.join(tmp, f'quakes_{size}.geojson')
+            write_geojson(path, size, seed=seed)
+
+            def parse():
+                with open(path, 'r') as file:
+                    return json.load(file)
+
+            geojson = parse()
+            qd = QuakeData(geojson)
+
+            def filter_latency(location_filter, property_filter):
+                qd.location_filter = location_filter
+                qd.property_filter = property_filter
+                return time_call(qd.compute_filtered_mask, repeat)
+
+            def stats():
+                qd.build_magnitude_stats()
+                qd.get_magnitude_stats()
+                qd.get_exceptional_quakes()
+
+            result = {
+                'file_mb': os.path.getsize(path) / 1024 ** 2,
+                'parse_s': time_call(parse, repeat),
+                'construct_s': time_call(lambda: QuakeData(geojson), repeat),
+                'stream_load_s': time_call(lambda: QuakeData.from_path(path), repeat),
+                'filter_property_s': filter_latency((0.0, 0.0, 0), (5.0, 1000, 1000)),
+                'filter_location_s': filter_latency((52.1, -106.6, 5000), (0.0, 0, 0)),
+                'filter_combined_s': filter_latency((52.1, -106.6, 5000), (5.0, 1000, 1000)),
+            }
+
+            # stats on the whole catalog, then with a property filter
+            qd.location_filter, qd.property_filter = (0.0, 0.0, 0), (0.0, 0, 0)
+            result['stats_s'] = time_call(stats, repeat)
+            qd.property_filter = (5.0, 1000, 1000)
+            result['stats_filtered_s'] = time_call(stats, repeat)
+
+            # peak memory of loading the file in a fresh process
+            with context.Pool(1) as pool:
+                result['stream_load_peak_rss_mb'] = pool.apply(load_and_measure, (path, 'from_path', 10000))[2]
+
+            results[str(size)] = result
+            del geojson, qd
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpus': os.cpu_count(),
+            'seed': seed,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare_results(baseline, current, threshold=0.2, min_delta=0.0005):
+    """This function is responsible for returning a list of (size, metric, baseline, current, ratio) for every
+        measurement that is more than threshold (0.2 = 20%) slower or bigger than in the baseline. Differences
+        smaller than min_delta are ignored, since timings of a few microseconds are mostly noise."""
+
+    regressions = []
+    for size, metrics in current['results'].items():
+        for metric, value in metrics.items():
+            base = baseline['results'].get(size, {}).get(metric)
+            # the file size is what was measured, not a measurement
+            if base is None or metric == 'file_mb' or base <= 0:
+                continue
+            ratio = value / base
+            if ratio > 1 + threshold and value - base > min_delta:
+                regressions.append((size, metric, base, value, ratio))
+
+    return regressions
+
+
+def print_suite(results):
+    """This function is responsible for printing the suite results as a table, one column per size"""
+
+    sizes = list(results['results'])
+    metrics = list(results['results'][sizes[0]])
+
+    print(f"{'metric':<26}" + ''.join(f"{size:>14}" for size in sizes))
+    for metric in metrics:
+        print(f"{metric:<26}" + ''.join(f"{results['results'][size][metric]:>14.5f}" for size in sizes))
+
+
+# the comparison benchmarks that can be picked with --only
+BENCHMARKS = {
+    'filter': bench_filter,
+    'distance': bench_distance,
+    'index': bench_spatial_index,
+    'ingest': bench_ingest,
+    'storage': bench_storage,
+    'cache': bench_cache,
+    'sharded': bench_sharded,
+    'stats': bench_stats,
+    'upsert': bench_upsert,
+    'time': bench_time,
+    'property_index': bench_property_index,
+    'validate': bench_validate,
+    'parallel': bench_parallel,
+    'cluster': bench_cluster,
+    'nearest': bench_nearest,
+    'export': bench_export,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the earthquake analyser")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--only', choices=list(BENCHMARKS), help="run one of the comparison benchmarks")
+    parser.add_argument('--suite', action='store_true', help="run the standard suite instead of the comparisons")
+    parser.add_argument('--output', help="file to save the suite results to as json")
+    parser.add_argument('--compare', help="suite results json to check the new results against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="slowdown allowed before it's a regression")
+    parser.add_argument('--min-delta', type=float, default=0.0005, help="smallest difference that can be a regression")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if not (args.suite or args.output or args.compare):
+        for name, benchmark in BENCHMARKS.items():
+            if args.only in (None, name):
+                benchmark(args.sizes)
+        return
+
+    results = run_suite(args.sizes, args.repeat, args.seed)
+    print_suite(results)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+
+        regressions = compare_results(baseline, results, args.threshold, args.min_delta)
+        for size, metric, base, value, ratio in regressions:
+            print(f"REGRESSION {metric} at {size} rows: {base:.5f} -> {value:.5f} ({ratio:.2f}x)")
+
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions over {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
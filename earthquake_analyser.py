@@ -1,10 +1,14 @@
 import matplotlib.pyplot as plt
 from pathlib import Path
 import numpy as np
+import sys
+import argparse  # used for reading the args
+import csv
 import json
-import math
-import sys  # used for reading the args
-from earthquakes import QuakeData
+from earthquakes import make_quakes
+from quake_cache import load_quake_data
+from quake_export import EXPORT_FORMATS, export_quakes, write_quake_lines
+import quake_profiler
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -77,29 +81,18 @@ def clear_filters(qd):
 
 
 def display_quakes(qd):
-    """This function is responsible for displaying the filtered quakes"""
-    for quake in qd.get_filtered_array():
-        print(quake)
+    """This function is responsible for displaying the filtered quakes, written out in chunks rather than
+        printed one by one"""
+
+    write_quake_lines(qd.get_filtered_array(), sys.stdout)
 
 
 def display_exceptional_quakes(qd):
     """This function is responsible for displaying exceptional quakes, which are quakes that have a
     magnitude greater than or equal to one standard deviation above the median magnitude"""
 
-    # list of all magnitudes
-    quakes = [quake for quake in qd.get_filtered_list()]
-    magnitudes = [q.mag for q in quakes]
-
-    # calculate the median, std. dev, and threshold of the magnitudes
-    median = np.median(magnitudes)
-    std_dev = np.std(magnitudes)
-    threshold = median + std_dev
-
-    # filter for quakes that are greater than or equal to one std.dev above median
-    exceptional_quakes = [quake for quake in quakes if quake.mag >= threshold]
-
     # print out the exceptional quakes
-    for quake in exceptional_quakes:
+    for quake in make_quakes(qd.get_exceptional_quakes()):
         print(quake)
 
 
@@ -107,53 +100,144 @@ def display_magnitude_stats(qd):
     """This function is responsible for displaying the Mean, Median, and Standard Deviation of the
         magnitude values of the filtered quakes """
 
-    # list of all magnitudes
-    magnitudes = [entry[1] for entry in qd.quake_array]
-    rounded_down_mags = [math.floor(mag) for mag in magnitudes]
-
-    # calculate the mean, median, and std. dev of the magnitudes
-    mean = np.mean(magnitudes)
-    median = np.median(magnitudes)
-    std_dev = np.std(magnitudes)
+    # the mean, median, std. dev and mode of the filtered magnitudes
+    stats = qd.get_magnitude_stats()
 
-    # calculate the mode by getting counts of the unique values, then
-    vals, counts = np.unique(rounded_down_mags, return_counts=True)
-    index = np.argmax(counts)
-
-    mode = vals[index]
+    if stats['count'] == 0:
+        print("\nNo quakes match the current filters\n")
+        return
 
     # building the output to be displayed to the user
-    stats = "\n----------------------------------------------\n"
-    stats += "|       Earthquake Magnitude Statistics      |\n"
-    stats += "----------------------------------------------\n"
-    stats += "|   Mean   |  Median  |  Std.Dev  |   Mode   |\n"
-    stats += "|--------------------------------------------|\n"
-    stats += "|   %.2f   |   %.2f   |    %.2f   |     %d    |\n" % (mean, median, std_dev, mode)
-    stats += "----------------------------------------------\n"
+    stats_output = "\n----------------------------------------------\n"
+    stats_output += "|       Earthquake Magnitude Statistics      |\n"
+    stats_output += "----------------------------------------------\n"
+    stats_output += "|   Mean   |  Median  |  Std.Dev  |   Mode   |\n"
+    stats_output += "|--------------------------------------------|\n"
+    stats_output += "|   %.2f   |   %.2f   |    %.2f   |     %d    |\n" % (
+        stats['mean'], stats['median'], stats['std_dev'], stats['mode'])
+    stats_output += "----------------------------------------------\n"
 
     # print stats
-    print(stats)
+    print(stats_output)
+
+
+def draw_and_show(stage, output=None):
+    """This function is responsible for showing the current figure, or saving it to the output file instead of
+        opening a window. When profiling, the figure is drawn once first so the drawing can be timed apart from
+        the time the window stays open."""
+
+    if quake_profiler.ENABLED:
+        with quake_profiler.timer(stage):
+            plt.gcf().canvas.draw()
+
+    if output is None:
+        plt.show()
+    else:
+        plt.savefig(output, dpi=150, bbox_inches='tight')
+        plt.close()
+        print(f"Saved to {output}")
+
+
+# above this many quakes the map is drawn as a grid instead of one marker per quake
+MAP_POINT_LIMIT = 100000
+
+
+def stratified_sample(magnitudes, size, seed=0):
+    """
+        This function is responsible for picking the indices of at most size quakes to draw, sampling each whole
+        magnitude separately so the large quakes are always kept.
+
+        The whole magnitudes share out the sample from the largest down, each taking all of its quakes or an
+        equal share of what is left, so the rare large quakes are kept whole and the common small ones make up
+        the rest. The indices come back in order of magnitude, so the large quakes are drawn on top.
+    """
+
+    strata = np.floor(magnitudes)
+    if len(magnitudes) <= size:
+        return np.argsort(magnitudes, kind='stable')
+
+    # the number of quakes each whole magnitude gets, largest first
+    values, counts = np.unique(strata, return_counts=True)
+    takes = np.empty_like(counts)
+    left = size
+    for i in range(len(values) - 1, -1, -1):
+        takes[i] = min(counts[i], left // (i + 1))
+        left -= takes[i]
+
+    # shuffle within each whole magnitude, then keep the first takes of each
+    order = np.lexsort((np.random.default_rng(seed).random(len(magnitudes)), strata))
+    groups = np.searchsorted(values, strata[order])
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    keep = order[np.arange(len(order)) - starts[groups] < takes[groups]]
+
+    return keep[np.argsort(magnitudes[keep], kind='stable')]
+
+
+def grid_magnitudes(longitudes, latitudes, magnitudes, cell_size=1.0, weight='max'):
+    """This function is responsible for binning the quakes into a cell_size degree long/lat grid, returning the
+        max or mean magnitude (or the count, for weight 'count') of each cell as a masked array of rows of
+        latitude, with the empty cells masked"""
 
+    n_cols = int(np.ceil(360 / cell_size))
+    n_rows = int(np.ceil(180 / cell_size))
 
-def plot_quake_map(qd):
+    cols = np.clip(((longitudes + 180) // cell_size).astype(np.int64), 0, n_cols - 1)
+    rows = np.clip(((latitudes + 90) // cell_size).astype(np.int64), 0, n_rows - 1)
+    cells = rows * n_cols + cols
+
+    counts = np.bincount(cells, minlength=n_rows * n_cols)
+    if weight == 'count':
+        grid = counts.astype(np.float64)
+    elif weight == 'mean':
+        grid = np.bincount(cells, weights=magnitudes, minlength=n_rows * n_cols) / np.maximum(counts, 1)
+    else:
+        grid = np.full(n_rows * n_cols, -np.inf)
+        np.maximum.at(grid, cells, magnitudes)
+
+    return np.ma.masked_array(grid, mask=counts == 0).reshape(n_rows, n_cols)
+
+
+def plot_quake_map(qd, mode='auto', output=None, point_limit=MAP_POINT_LIMIT, cell_size=1.0, weight='max'):
     """
         This function is responsible for calculating and plotting the quakes on a flattened world map, distinguishing
         quakes by size and by color.
 
+        Up to point_limit quakes are drawn as one marker each, and past that (mode 'auto') the map switches to a
+        grid of cell_size degree cells colored by the max or mean magnitude (or the count) of the quakes in them,
+        since drawing that many markers takes minutes. mode 'scatter' or 'grid' picks one way or the other, and
+        mode 'sample' draws a magnitude-stratified sample of point_limit quakes that keeps the largest ones. The
+        map is saved to output if given, instead of opening a window.
+
         Colorbar/cmap: https://matplotlib.org/stable/users/explain/colors/colormaps.html
     """
 
-    # list of all latitudes
-    latitudes = [quake.lat for quake in qd.get_filtered_array()]
-    # list of all longitudes
-    longitudes = [quake.long for quake in qd.get_filtered_array()]
-    # list of all magnitudes
-    magnitudes = [quake.mag for quake in qd.get_filtered_array()]
+    quakes = qd.get_filtered_array()
+
+    if mode == 'auto':
+        mode = 'scatter' if len(quakes) <= point_limit else 'grid'
+    if mode == 'sample':
+        quakes = quakes[stratified_sample(quakes['magnitude'], point_limit)]
 
-    # plotting the magnitudes on a flattened world map, using colors and size for the magnitude
+    # all latitudes
+    latitudes = quakes['lat']
+    # all longitudes
+    longitudes = quakes['long']
+    # all magnitudes
+    magnitudes = quakes['magnitude']
+
+    # plotting the magnitudes on a flattened world map, with longitude across and latitude up
     plt.figure(figsize=(10, 8))
-    sc = plt.scatter(x=latitudes, y=longitudes, s=[mag ** 4.0 for mag in magnitudes], c=magnitudes, cmap='viridis',
-                     edgecolor='black', alpha=0.55)  # couldn't choose a color, so I chose a gradient
+    with quake_profiler.timer('render.quake_map'):
+        if mode == 'grid':
+            grid = grid_magnitudes(longitudes, latitudes, magnitudes, cell_size, weight)
+            sc = plt.imshow(grid, origin='lower', extent=(-180, -180 + grid.shape[1] * cell_size,
+                                                          -90, -90 + grid.shape[0] * cell_size),
+                            cmap='viridis', aspect='auto', interpolation='nearest')
+        else:
+            # the black edges are only worth drawing while the markers don't cover each other
+            edgecolor = 'black' if len(quakes) <= 10000 else 'none'
+            sc = plt.scatter(x=longitudes, y=latitudes, s=magnitudes ** 4.0, c=magnitudes, cmap='viridis',
+                             edgecolor=edgecolor, alpha=0.55)  # couldn't choose a color, so I chose a gradient
 
     # set the title and horizontal/vertical labels for the scatter map
     plt.xlabel('Longitude')
@@ -162,9 +246,14 @@ def plot_quake_map(qd):
 
     # set the colorbar to be based on the values in the scatter
     cbar = plt.colorbar(sc)
-    cbar.set_label('Magnitude')
+    if mode != 'grid':
+        cbar.set_label('Magnitude')
+    elif weight == 'count':
+        cbar.set_label('Quakes')
+    else:
+        cbar.set_label(f"{weight.capitalize()} Magnitude")
 
-    plt.show()
+    draw_and_show('render.quake_map.draw', output)
 
 
 def plot_magnitude_chart(qd):
@@ -173,10 +262,9 @@ def plot_magnitude_chart(qd):
         Numpy Histogram info - https://www.geeksforgeeks.org/numpy-histogram-method-in-python/
                              - https://stackoverflow.com/questions/9141732/how-does-numpy-histogram-work
     """
-    # list of magnitudes
-    magnitudes = [quake.mag for quake in qd.get_filtered_list()]
-    # list of whole number magnitudes from magnitudes
-    whole_num_mags = [mag for mag in magnitudes if type(mag) is int]
+    # the magnitudes are stored as floats, so whole numbers are the ones with nothing after the decimal point
+    magnitudes = qd.get_filtered_array()['magnitude']
+    whole_num_mags = magnitudes[magnitudes == np.floor(magnitudes)]
     # list of colors to set the bar colors
     bar_colors = ['tab:red', 'tab:blue', 'tab:green', 'tab:orange', 'tab:purple',
                   'tab:pink', 'tab:gray', 'tab:cyan', 'tab:brown', 'tab:olive']
@@ -200,7 +288,7 @@ def plot_magnitude_chart(qd):
     plt.ylabel('Frequency')
     plt.xlabel('Magnitude')
 
-    plt.show()
+    draw_and_show('render.magnitude_chart.draw')
 
 
 def get_menu_input(qd):
@@ -228,24 +316,11 @@ def get_menu_input(qd):
         quit()
 
 
-def analyse_earthquakes():
-    """This function is used to start begin this Earthquakes Analysis
-
-        sys.argv - https://www.tutorialspoint.com/python/python_command_line_arguments.htm
-    """
-
-    path = "earthquakes.geojson"
-
-    # check for passed in arg for filename
-    if len(sys.argv) > 1:
-        path = Path(sys.argv[1])
-
-    # read json file
-    with open(path, 'r') as file:
-        data = json.load(file)
+def analyse_earthquakes(path="earthquakes.geojson"):
+    """This function is used to start begin this Earthquakes Analysis"""
 
-    # create QuakeData obj
-    quake_data = QuakeData(data)
+    # create QuakeData obj, from the cache if the json file hasn't changed since it was last parsed
+    quake_data = load_quake_data(path)
 
     # start session
     while True:
@@ -253,4 +328,148 @@ def analyse_earthquakes():
         get_menu_input(quake_data)
 
 
-analyse_earthquakes()
+def parse_filter(value, names, default=0):
+    """This function is responsible for turning a filter from a batch query, given either as a list of values or
+        a dict keyed by names, into a tuple in the order of names"""
+
+    if isinstance(value, dict):
+        return tuple(value.get(name, default) for name in names)
+    return tuple(value) + (default,) * (len(names) - len(value))
+
+
+def run_query(qd, query):
+    """
+        This function is responsible for running one batch query against the QuakeData obj, returning the
+        output rows as dicts. Each query sets its own filters, so queries don't depend on the ones before them:
+
+            {"id": "q1", "query": "stats", "location": [lat, long, distance], "property": [mag, felt, sig],
+             "time": [start, end]}
+
+        The query can be "stats", "count", "exceptional", "quakes" or "time_counts", and the filters can also be
+        given as dicts like {"magnitude": 5}. Times are epoch ms or ISO 8601 strings, and either end can be null.
+        A missing filter is cleared. "time_counts" outputs one row per non-empty "bucket" ("hour", "day" or a
+        size in ms, "day" by default).
+    """
+
+    qd.clear_filters(verbose=False)
+    if 'location' in query:
+        lat, long, dist = parse_filter(query['location'], ('latitude', 'longitude', 'distance'))
+        qd.set_location_filter(float(lat), float(long), int(dist), verbose=False)
+    if 'property' in query:
+        mag, felt, sig = parse_filter(query['property'], ('magnitude', 'felt', 'significance'))
+        qd.set_property_filter(float(mag), int(felt), int(sig), verbose=False)
+    if 'time' in query:
+        start, end = parse_filter(query['time'], ('start', 'end'), None)
+        qd.set_time_filter(start, end, verbose=False)
+
+    kind = query.get('query', 'stats')
+    base = {'id': query.get('id'), 'query': kind}
+
+    if kind == 'stats':
+        stats = qd.get_magnitude_stats()
+        # no matching quakes gives nan stats, which aren't valid json
+        return [dict(base, **{key: None if value != value else value for key, value in stats.items()})]
+    if kind == 'count':
+        return [dict(base, count=int(np.count_nonzero(qd.get_filtered_mask())))]
+    if kind in ('exceptional', 'quakes'):
+        quakes = qd.get_exceptional_quakes() if kind == 'exceptional' else qd.get_filtered_array()
+        return [dict(base, magnitude=mag, felt=felt, significance=sig, lat=lat, long=long, time=time,
+                     q_type=q_type.decode())
+                for mag, felt, sig, lat, long, time, q_type
+                in zip(quakes['magnitude'].tolist(), quakes['felt'].tolist(), quakes['significance'].tolist(),
+                       quakes['lat'].tolist(), quakes['long'].tolist(), quakes['time'].tolist(),
+                       quakes['q_type'].tolist())]
+    if kind == 'time_counts':
+        starts, counts = qd.get_time_counts(query.get('bucket', 'day'))
+        return [dict(base, time=start, count=count) for start, count in zip(starts.tolist(), counts.tolist())]
+
+    raise ValueError(f"Unknown query type: {kind}")
+
+
+# every column a batch query can output, in the order they are written as csv
+BATCH_COLUMNS = ['id', 'query', 'count', 'mean', 'median', 'std_dev', 'mode',
+                 'magnitude', 'felt', 'significance', 'lat', 'long', 'time', 'q_type', 'error']
+
+
+def run_batch(qd, queries, out, output_format='jsonl'):
+    """This function is responsible for running every query (one JSON object per line) against the already
+        loaded QuakeData obj, and writing the results to out as JSON Lines or CSV as each query finishes"""
+
+    if output_format == 'csv':
+        writer = csv.DictWriter(out, fieldnames=BATCH_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        write_rows = writer.writerows
+    else:
+        def write_rows(rows):
+            out.writelines(json.dumps(row) + '\n' for row in rows)
+
+    for line_number, line in enumerate(queries, start=1):
+        line = line.strip()
+        # skip blank lines and comments
+        if not line or line.startswith('#'):
+            continue
+
+        query = None
+        try:
+            query = json.loads(line)
+            rows = run_query(qd, query)
+        except (ValueError, TypeError, KeyError, AttributeError, OverflowError) as error:
+            # report the bad query in the output and carry on with the rest
+            query_id = query.get('id') if isinstance(query, dict) else None
+            rows = [{'id': query_id, 'query': f'line {line_number}', 'error': str(error)}]
+
+        write_rows(rows)
+
+
+def main(argv=None):
+    """
+        This function is used to read the command line args and start either the interactive menu, or a batch of
+        queries with --batch, which prints its results to stdout
+
+        argparse - https://docs.python.org/3/library/argparse.html
+    """
+
+    parser = argparse.ArgumentParser(description="Earthquake Analyser")
+    parser.add_argument('path', nargs='?', default="earthquakes.geojson", type=Path, help="geojson file to analyse")
+    parser.add_argument('--batch', metavar='QUERIES',
+                        help="file of JSON Lines queries to run without the menu, or - for stdin")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl', help="output format for --batch")
+    parser.add_argument('--export', metavar='FILE',
+                        help="write the whole catalog to FILE without the menu, as csv, arrow, feather or parquet "
+                             "(picked by the extension, or --export-format)")
+    parser.add_argument('--export-format', choices=list(EXPORT_FORMATS), help="format for --export")
+    parser.add_argument('--map-output', metavar='FILE',
+                        help="save the quake map of the whole catalog to FILE (e.g. map.png) without the menu")
+    parser.add_argument('--map-mode', choices=['auto', 'scatter', 'grid', 'sample'], default='auto',
+                        help=f"how to draw the quake map, auto draws a grid past {MAP_POINT_LIMIT} quakes")
+    parser.add_argument('--map-weight', choices=['max', 'mean', 'count'], default='max',
+                        help="what colors the cells of a grid map")
+    args = parser.parse_args(argv)
+
+    if args.export is not None:
+        export_quakes(load_quake_data(args.path), args.export, args.export_format)
+        return
+
+    if args.map_output is not None:
+        # no window is needed, so don't depend on a display
+        plt.switch_backend('Agg')
+        plot_quake_map(load_quake_data(args.path), args.map_mode, args.map_output, weight=args.map_weight)
+        return
+
+    if args.batch is None:
+        analyse_earthquakes(args.path)
+        return
+
+    quake_data = load_quake_data(args.path)
+
+    if args.batch == '-':
+        run_batch(quake_data, sys.stdin, sys.stdout, args.format)
+    else:
+        with open(args.batch, 'r') as queries:
+            run_batch(quake_data, queries, sys.stdout, args.format)
+
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,18 @@
 import numpy as np
+import glob
+import json
 import math
+import os
+import re
+from collections import OrderedDict
+from itertools import chain
+from operator import itemgetter
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import quake_profiler
+from quake_index import MagnitudeStats, SortedIndex, summarise_magnitudes
+from quake_spatial import (EARTH_RADIUS, SpatialIndex, UnitVectorGrid, calc_distances, cluster_points,
+                           summarise_clusters)
 from math import asin, sin, cos, sqrt, radians
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -11,6 +24,7 @@ from math import asin, sin, cos, sqrt, radians
 #                                                   #
 # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
+
 def calc_distance(lat1, long1, lat2, long2):
     """
         This function is responsible for calculating the distance between two points based
@@ -21,7 +35,7 @@ def calc_distance(lat1, long1, lat2, long2):
 
     """
 
-    earth_rad = 6371
+    earth_rad = EARTH_RADIUS
 
     # get the radian values of the coordinates
     lat1_rad = radians(lat1)
@@ -41,26 +55,471 @@ def calc_distance(lat1, long1, lat2, long2):
     return distance
 
 
+# the columns the property filter checks, in the order of its values
+PROPERTY_COLUMNS = ('magnitude', 'felt', 'significance')
+# every column with a sorted index that has to be kept up to date
+INDEXED_COLUMNS = PROPERTY_COLUMNS + ('time',)
+
+# size of the named time buckets in ms
+TIME_BUCKETS = {'hour': 3600 * 1000, 'day': 24 * 3600 * 1000}
+
+
+def to_epoch_ms(value):
+    """This function is responsible for turning a time given as epoch ms, a datetime or an ISO 8601 string
+        into epoch ms. Datetimes without a timezone are taken to be UTC, and None stays None."""
+
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(round(value.timestamp() * 1000))
+
+    return int(value)
+
+
 def has_invalid_props(qp):
     """This function is a helper function for checking the properties of the features from the geojson to
         determine if all the necessary properties exist"""
 
-    # flag starts out as false
-    flag = False
+    # missing properties, or a missing property, count the same as a null one
+    return any(get_item(qp, field) is None for field in ('mag', 'time', 'felt', 'sig', 'type'))
+
+
+def get_rejection(quake):
+    """This function is responsible for validating a single feature from the geojson, returning the name of
+        the first rule it breaks, or None if it is a valid quake. Missing keys are treated as None, the same as
+        validate_chunk does, so both give the same answer for any feature."""
+
+    # isolate quake properties
+    qp = get_item(quake, 'properties')
+    geometry = get_item(quake, 'geometry')
+    coords = get_item(geometry, 'coordinates')
+
+    # skip if not a features
+    if get_item(quake, 'type') != 'Feature':
+        return 'not_feature'
+    # skip if there are missing props
+    if has_invalid_props(qp):
+        return 'missing_props'
+    # skip if geomerty type does not equal point
+    if get_item(geometry, 'type') != "Point":
+        return 'not_point'
+    # skip if geometry coordinates are not a list
+    if type(coords) is not list:
+        return 'coords_not_list'
+    # skip if geometry coordinates list is not of length 3
+    if len(coords) != 3:
+        return 'coords_not_3'
+    # skip if any of the numbers aren't finite numbers (bools count as ints in python, so check the exact type)
+    values = [qp['mag'], qp['time'], qp['felt'], qp['sig']] + coords
+    if any(type(value) not in NUMBER_TYPES or not is_finite(value) for value in values):
+        return 'not_numeric'
+    # skip if any of the whole numbers don't fit their column
+    if any(not is_in_range(value, dtype) for value, dtype in
+           ((qp['time'], 'int64'), (qp['felt'], 'int32'), (qp['sig'], 'int32'))):
+        return 'out_of_range'
+    # skip if the id or type don't fit their columns, since cutting them short would change them
+    if len(str(get_item(quake, 'id') or '').encode()) > np.dtype(QUAKE_DTYPE)['id'].itemsize:
+        return 'id_too_long'
+    if len(str(qp['type']).encode()) > np.dtype(QUAKE_DTYPE)['q_type'].itemsize:
+        return 'type_too_long'
+
+    return None
+
+
+def is_finite(value):
+    """This function is responsible for checking whether a number is finite and fits in a float"""
+
+    try:
+        return math.isfinite(value)
+    except OverflowError:
+        return False
+
+
+def get_finite(values):
+    """This function is responsible for checking which numbers of an object array are finite and fit in a
+        float"""
+
+    try:
+        return np.isfinite(values.astype(np.float64))
+    except OverflowError:
+        # ints too big to be a float, so check them one at a time
+        return np.fromiter(map(is_finite, values), dtype=bool, count=len(values))
+
+
+def is_in_range(value, dtype):
+    """This function is responsible for checking whether a number fits in an integer dtype once any fraction
+        is dropped"""
+
+    info = np.iinfo(dtype)
+    return info.min <= value < info.max + 1
+
+
+def get_in_range(values, dtype):
+    """This function is responsible for checking which numbers of an object array fit in an integer dtype once
+        any fraction is dropped"""
+
+    info = np.iinfo(dtype)
+    try:
+        numbers = values.astype(np.float64)
+    except OverflowError:
+        # ints too big to even be a float
+        numbers = np.full(len(values), np.inf)
+
+    fits = (numbers >= info.min) & (numbers < float(info.max) + 1)
+    # past 2^53 a float can't tell ints apart (and nan isn't anything), so those are checked one at a time
+    unsure = ~(np.abs(numbers) < 2.0 ** 53)
+    fits[unsure] = [is_in_range(value, dtype) for value in values[unsure]]
+
+    return fits
+
+
+# the rules a feature is checked against, in order. A rejected feature is counted against the first one it breaks.
+REJECTION_RULES = ('not_feature', 'missing_props', 'not_point', 'coords_not_list', 'coords_not_3', 'not_numeric',
+                   'out_of_range', 'id_too_long', 'type_too_long')
+# the types a json number is decoded as
+NUMBER_TYPES = (int, float)
+# features validated at once, few enough that their dicts stay in the cpu cache between the passes over them
+VALIDATION_CHUNK_SIZE = 10000
+
+
+def get_field(items, field):
+    """This function is responsible for pulling a field out of every dict in items into an object array.
+        Missing fields, or items that aren't dicts, give None."""
+
+    try:
+        # itemgetter does the lookups in C, and fromiter doesn't try to unpack lists (e.g. coordinates)
+        return np.fromiter(map(itemgetter(field), items), dtype=object, count=len(items))
+    except (KeyError, IndexError, TypeError):
+        return np.fromiter((get_item(item, field) for item in items), dtype=object, count=len(items))
+
+
+def get_item(item, field):
+    """This function is responsible for looking up a field of a dict or an index of a list, giving None if
+        there isn't one"""
+
+    try:
+        return item[field]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def is_type(values, types):
+    """This function is responsible for checking which values of an object array are exactly one of the types
+        (so a bool doesn't count as an int)"""
+
+    # nearly always every value is fine, which is quick to check
+    if set(map(type, values)) <= set(types):
+        return np.ones(len(values), dtype=bool)
+
+    return np.isin(np.frompyfunc(type, 1, 1)(values), types)
+
+
+def get_numbers(values):
+    """This function is responsible for checking which values of an object array are finite numbers, the same
+        way get_rejection does"""
+
+    numbers = is_type(values, NUMBER_TYPES)
+    numbers[numbers] = get_finite(values[numbers])
+
+    return numbers
+
+
+def encode_strings(values, dtype):
+    """This function is responsible for turning an object array of values into utf-8 encoded byte strings.
+        Values that aren't strings (numbers, lists, ...) are turned into one with str first, like get_quake_row
+        does."""
+
+    # plain ascii strings, which is nearly always the case, can be converted straight across
+    if set(map(type, values)) <= {str}:
+        try:
+            return values.astype(dtype)
+        except UnicodeEncodeError:
+            pass
+
+    return np.array([str(value).encode() for value in values], dtype=dtype)
+
+
+def validate_features(features, chunk_size=VALIDATION_CHUNK_SIZE):
+    """
+        This function is responsible for validating the features from the geojson a chunk at a time, returning
+        the quake array of the valid ones and the number of features rejected by each rule.
+    """
+
+    features = list(features)
+    arrays = []
+    rejections = dict.fromkeys(REJECTION_RULES, 0)
+
+    for start in range(0, len(features), chunk_size):
+        quake_array, chunk_rejections = validate_chunk(features[start:start + chunk_size])
+        arrays.append(quake_array)
+        for rule, rejected in chunk_rejections.items():
+            rejections[rule] += rejected
+
+    if not arrays:
+        return np.empty(0, dtype=QUAKE_DTYPE), rejections
+    return np.concatenate(arrays), rejections
+
+
+def validate_chunk(features):
+    """
+        This function is responsible for validating a chunk of features all at once, returning the quake array of
+        the valid ones and the number of features rejected by each rule.
+
+        Each field the rules look at is pulled out of every feature in one pass, and then each rule is checked
+        as a mask over all of them. Missing keys are treated as None, so they are rejected rather than raising.
+    """
+
+    props = get_field(features, 'properties')
+    geometry = get_field(features, 'geometry')
+    coords = get_field(geometry, 'coordinates')
+
+    # the numbers, then the type
+    values = [get_field(props, field) for field in ('mag', 'time', 'felt', 'sig', 'type')]
+
+    # coordinates are only looked at for the features with a list of 3 of them
+    is_list = is_type(coords, (list,))
+    lengths = np.full(len(features), -1)
+    lengths[is_list] = np.fromiter(map(len, coords[is_list]), dtype=np.int64, count=int(np.count_nonzero(is_list)))
+    has_3 = lengths == 3
+    count_3 = int(np.count_nonzero(has_3))
+    coord_values = np.full((len(features), 3), None, dtype=object)
+    coord_values[has_3] = np.fromiter(chain.from_iterable(coords[has_3]), dtype=object,
+                                      count=3 * count_3).reshape(count_3, 3)
+    numeric_coords = np.zeros(len(features), dtype=bool)
+    numeric_coords[has_3] = get_numbers(coord_values[has_3].ravel()).reshape(count_3, 3).all(axis=1)
+
+    masks = {
+        'not_feature': get_field(features, 'type') != 'Feature',
+        'missing_props': np.logical_or.reduce([np.equal(column, None) for column in values]),
+        'not_point': get_field(geometry, 'type') != 'Point',
+        'coords_not_list': ~is_list,
+        'coords_not_3': ~has_3,
+        'not_numeric': ~np.logical_and.reduce([get_numbers(column) for column in values[:4]] + [numeric_coords]),
+    }
 
-    # if any of the if statements hit, flag will be true
-    if qp['mag'] is None:
-        flag = True
-    elif qp['time'] is None:
-        flag = True
-    elif qp['felt'] is None:
-        flag = True
-    elif qp['sig'] is None:
-        flag = True
-    elif qp['type'] is None:
-        flag = True
+    # the whole numbers have to fit their columns, which can only be checked once they are known to be numbers
+    numeric = ~masks['not_numeric']
+    fits = np.zeros(len(features), dtype=bool)
+    fits[numeric] = np.logical_and.reduce([get_in_range(column[numeric], dtype) for column, dtype
+                                           in ((values[1], 'int64'), (values[2], 'int32'), (values[3], 'int32'))])
+    masks['out_of_range'] = ~fits
 
-    return flag
+    # features without an id get an empty one. The ids and types are encoded a byte wider than their columns,
+    # so the ones that would be cut short fill it.
+    ids = get_field(features, 'id')
+    ids[~ids.astype(bool)] = ''
+    texts = {}
+    for column, rule, text in (('id', 'id_too_long', ids), ('q_type', 'type_too_long', values[4])):
+        size = np.dtype(QUAKE_DTYPE)[column].itemsize
+        texts[column] = encode_strings(text, f'S{size + 1}')
+        masks[rule] = np.char.str_len(texts[column]) > size
+
+    # count each rejected feature against the first rule it breaks
+    rejected = np.zeros(len(features), dtype=bool)
+    rejections = {}
+    for rule in REJECTION_RULES:
+        broken = masks[rule] & ~rejected
+        rejections[rule] = int(np.count_nonzero(broken))
+        rejected |= broken
+        if quake_profiler.ENABLED and rejections[rule]:
+            quake_profiler.count(f'rows_rejected.{rule}', rejections[rule])
+
+    valid = ~rejected
+    mags, times, felt, sig = [column[valid] for column in values[:4]]
+
+    quake_array = np.empty(len(mags), dtype=QUAKE_DTYPE)
+    quake_array['magnitude'] = mags.astype(np.float64)
+    quake_array['felt'] = felt.astype(np.int64)
+    quake_array['significance'] = sig.astype(np.int64)
+    quake_array['lat'] = coord_values[valid, 0].astype(np.float64)
+    quake_array['long'] = coord_values[valid, 1].astype(np.float64)
+    quake_array['time'] = times.astype(np.int64)
+    quake_array['q_type'] = texts['q_type'][valid]
+    quake_array['id'] = texts['id'][valid]
+
+    return quake_array, rejections
+
+
+def get_quake_row(quake):
+    """This function is responsible for validating a single feature from the geojson, returning the row to
+        store in the quake array, or None if the feature should be skipped"""
+
+    rejection = get_rejection(quake)
+    if rejection is not None:
+        if quake_profiler.ENABLED:
+            quake_profiler.count(f'rows_rejected.{rejection}')
+        return None
+
+    qp = quake['properties']
+    coords = quake['geometry']['coordinates']
+
+    # quake is valid, return its row
+    return (float(qp['mag']), int(qp['felt']), int(qp['sig']), float(coords[0]), float(coords[1]),
+            int(qp['time']), str(qp['type']).encode(), str(quake.get('id') or '').encode())
+
+
+def iter_features(path, read_size=65536):
+    """
+        This function is responsible for reading the features of a geojson file one at a time, so the whole
+        file never has to be held in memory. The file is read read_size characters at a time, and each feature
+        is decoded off the front of the buffer as soon as all of it has been read.
+    """
+
+    decoder = json.JSONDecoder()
+    # matches the whitespace and commas between features
+    separator = re.compile(r'[\s,]*')
+    features_start = re.compile(r'"features"\s*:\s*\[')
+
+    with open(path, 'r') as file:
+
+        # characters of the file dropped from the front of the buffer so far, for error messages
+        dropped = 0
+
+        # read until the start of the features array
+        buffer = ''
+        while True:
+            match = features_start.search(buffer)
+            if match:
+                break
+            block = file.read(read_size)
+            if not block:
+                return
+            # keep the tail in case the key was split between blocks
+            dropped += max(len(buffer) - 32, 0)
+            buffer = buffer[-32:] + block
+
+        pos = match.end()
+        while True:
+            pos = separator.match(buffer, pos).end()
+
+            if pos < len(buffer):
+                # end of the features array
+                if buffer[pos] == ']':
+                    return
+                try:
+                    feature, pos = decoder.raw_decode(buffer, pos)
+                    yield feature
+                    continue
+                except json.JSONDecodeError as error:
+                    # only an error that could be the feature running past the end of the buffer means reading
+                    # more, anything else is bad json that more of the file won't fix
+                    if not is_cut_short(error, buffer):
+                        raise ValueError(f"Invalid json in the features of {path} at character "
+                                         f"{dropped + error.pos}: {error.msg}") from error
+
+            block = file.read(read_size)
+            if not block:
+                raise ValueError(f"Unexpected end of file while reading the features of {path}")
+            dropped += pos
+            buffer = buffer[pos:] + block
+            pos = 0
+
+
+def is_cut_short(error, buffer):
+    """This function is responsible for checking whether a json decode error could just be because the buffer
+        ends part way through a value, rather than the json being bad"""
+
+    # a string runs to the end of the buffer, or the error is within the longest literal (-Infinity) of the end
+    return error.msg.startswith('Unterminated string') or error.pos >= len(buffer) - len('-Infinity')
+
+
+def append_rows(quake_array, count, rows):
+    """This function is responsible for copying rows into the quake array after the first count rows,
+        doubling its size as many times as needed to fit them"""
+
+    size = len(quake_array)
+    while count + len(rows) > size:
+        size = max(size * 2, 1)
+
+    if size != len(quake_array):
+        quake_array.resize(size, refcheck=False)
+
+    quake_array[count:count + len(rows)] = rows
+    return quake_array
+
+
+def load_quake_array(path, chunk_size=10000):
+    """This function is responsible for parsing a single geojson file into a quake array, returned along with
+        its rejection counts. It is module level so the worker processes of QuakeData.from_paths can run it."""
+
+    quake_data = QuakeData.from_path(path, chunk_size=chunk_size)
+    return quake_data.quake_array, quake_data.rejections
+
+
+# columns of the structured quake array, all fixed size so the array can be saved/mapped as raw bytes
+QUAKE_DTYPE = [
+    ('magnitude', 'float64'),
+    ('felt', 'int32'),
+    ('significance', 'int32'),
+    ('lat', 'float64'),
+    ('long', 'float64'),
+    ('time', 'int64'),
+    ('q_type', 'S32'),
+    ('id', 'S24')
+]
+
+
+def evaluate_filters(quakes, location_filter, property_filter, time_filter, candidates=None, out=None):
+    """
+        This function is responsible for evaluating the Location/Property/Time filters as boolean masks over the
+        columns of quakes (a quake array, or part of one), writing the mask to out if given. If candidates are
+        given, they are the only quakes that can be too close to the location, so the distance is only measured
+        for them.
+
+        Returns the mask and how many distances were measured.
+    """
+
+    lat_f, long_f, dist_f = location_filter
+    mag_f, felt_f, sig_f = property_filter
+    start_f, end_f = time_filter
+
+    # property filters are simple comparisons against the numeric columns
+    mask = np.greater_equal(quakes['magnitude'], float(mag_f), out=out)
+    mask &= quakes['significance'] >= int(sig_f)
+    mask &= quakes['felt'] >= int(felt_f)
+
+    # and so is the time filter
+    if start_f is not None:
+        mask &= quakes['time'] >= start_f
+    if end_f is not None:
+        mask &= quakes['time'] < end_f
+
+    # every distance is >= 0, so the location filter only matters for a positive distance
+    if int(dist_f) <= 0:
+        return mask, 0
+
+    # only measure the distance for the quakes that passed the property filters
+    if candidates is None:
+        indices = np.flatnonzero(mask)
+    else:
+        indices = candidates[mask[candidates]]
+
+    distances = calc_distances(quakes['lat'][indices], quakes['long'][indices], float(lat_f), float(long_f))
+    mask[indices] = distances >= int(dist_f)
+
+    return mask, len(indices)
+
+
+def get_row_keys(rows):
+    """This function is responsible for returning the key each row of a quake array is upserted by, which is
+        its id, or all of its bytes if it has no id so an exact repeat of it can still be recognised. Ids are at
+        most the width of the id column, so they can never be the same as the bytes of a whole row."""
+
+    return [quake_id or rows[i].tobytes() for i, quake_id in enumerate(rows['id'].tolist())]
+
+
+def make_quakes(quake_array):
+    """This function is responsible for creating Quake objs for the rows of a quake array, for when the
+        values are needed one quake at a time rather than as columns"""
+
+    return [Quake(mag, time, felt, sig, q_type.decode(), (lat, long)) for mag, felt, sig, lat, long, time, q_type
+            in zip(quake_array['magnitude'].tolist(), quake_array['felt'].tolist(),
+                   quake_array['significance'].tolist(), quake_array['lat'].tolist(), quake_array['long'].tolist(),
+                   quake_array['time'].tolist(), quake_array['q_type'].tolist())]
 
 
 class QuakeData:
@@ -68,67 +527,487 @@ class QuakeData:
 
     def __init__(self, geojson):
 
-        valid_quakes = []
-
-        # loop through features
-        for quake in geojson['features']:
-
-            # isolate quake properties
-            qp = quake['properties']
-
-            # skip if not a features
-            if quake['type'] != 'Feature':
-                continue
-            # skip if there are missing props
-            if has_invalid_props(qp):
-                continue
-            # skip if geomerty type does not equal point
-            if quake['geometry']['type'] != "Point":
-                continue
-            # skip if geometry coordinates are not a list
-            if not isinstance(quake['geometry']['coordinates'], list):
-                continue
-            # skip if geometry coordinates list is not of length 3
-            if len(quake['geometry']['coordinates']) != 3:
-                continue
-            coords = quake['geometry']['coordinates']
-            for coord in coords:
-                # for each coord, skip if it is not a number
-                if type(coord) is not int or type(coord) is not float:
-                    continue
+        with quake_profiler.timer('construct'):
+            # validate all the features at once, keeping the valid ones
+            quake_array, rejections = validate_features(geojson['features'])
+
+            # create structured array
+            self.set_quake_array(quake_array)
+            self.rejections = rejections
+
+        quake_profiler.count('rows_parsed', len(geojson['features']))
+        quake_profiler.count('rows_valid', len(quake_array))
+
+    @classmethod
+    def from_array(cls, quake_array):
+        """This function is responsible for creating a QuakeData obj around an already built quake array"""
+
+        quake_data = cls.__new__(cls)
+        quake_data.set_quake_array(quake_array)
+        return quake_data
+
+    @classmethod
+    @quake_profiler.timed('load.stream')
+    def from_path(cls, path, chunk_size=10000):
+        """
+            This function is responsible for creating a QuakeData obj straight from a geojson file, without
+            loading the whole file first. Features are parsed one at a time and validated the same way as
+            __init__, a chunk_size batch at a time, and the valid rows are copied into a quake array that doubles
+            when full.
+        """
+
+        quake_array = np.empty(chunk_size, dtype=QUAKE_DTYPE)
+        count = 0
+        features = []
+        parsed = 0
+        rejections = dict.fromkeys(REJECTION_RULES, 0)
+
+        def add_chunk():
+            # validate the chunk of features, and copy the valid ones into the array, growing it if needed
+            rows, chunk_rejections = validate_features(features)
+            for rule, rejected in chunk_rejections.items():
+                rejections[rule] += rejected
+            return append_rows(quake_array, count, rows), len(rows)
+
+        for feature in iter_features(path):
+            parsed += 1
+            features.append(feature)
+
+            if len(features) == chunk_size:
+                quake_array, added = add_chunk()
+                count += added
+                features = []
 
-            # create quake obj
-            valid_quake = Quake(
-                qp['mag'], qp['time'], int(qp['felt']), int(qp['sig']), qp['type'],
-                (coords[0], coords[1]))
-
-            # quake is valid, add to list
-            valid_quakes.append(
-                (valid_quake, float(qp['mag']), int(qp['felt']), int(qp['sig']), float(coords[0]), float(coords[1])))
-
-        # create structured array
-        self.quake_array = np.array(valid_quakes, dtype=[
-            ('quake', 'O'),
-            ('magnitude', 'float64'),
-            ('felt', 'int32'),
-            ('significance', 'int32'),
-            ('lat', 'float64'),
-            ('long', 'float64')
-        ])
+        quake_array, added = add_chunk()
+        count += added
+
+        # trim the unused space off the end
+        quake_array.resize(count, refcheck=False)
+
+        quake_profiler.count('rows_parsed', parsed)
+        quake_profiler.count('rows_valid', count)
+
+        quake_data = cls.from_array(quake_array)
+        quake_data.rejections = rejections
+        return quake_data
+
+    @classmethod
+    def from_paths(cls, paths, workers=None, chunk_size=10000):
+        """
+            This function is responsible for creating one QuakeData obj from many geojson files, which can be
+            given as a list of paths or a glob pattern. The files are parsed and validated in a pool of worker
+            processes (workers=None uses one per cpu), which send back their numeric quake arrays rather than
+            Quake objs. The arrays are joined in the order the paths were given (sorted, for a glob).
+        """
+
+        if isinstance(paths, str):
+            paths = sorted(glob.glob(paths))
+        paths = list(paths)
+
+        # no point starting processes for one file, or when asked for a single worker
+        if workers == 1 or len(paths) <= 1:
+            results = [load_quake_array(path, chunk_size) for path in paths]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # map hands the results back in the same order as the paths
+                results = list(executor.map(load_quake_array, paths, [chunk_size] * len(paths)))
+
+        if not results:
+            return cls.from_array(np.empty(0, dtype=QUAKE_DTYPE))
+
+        quake_data = cls.from_array(np.concatenate([quake_array for quake_array, _ in results]))
+        for _, rejections in results:
+            for rule, rejected in rejections.items():
+                quake_data.rejections[rule] += rejected
+        return quake_data
+
+    def set_quake_array(self, quake_array):
+        """This function is responsible for setting the quake array and resetting everything built from it"""
+
+        self.quake_array = quake_array
+        # the array the quake array is a view of, with room to append to
+        self.quake_buffer = quake_array
+        # how many features were rejected by each validation rule, when the quakes came from geojson
+        self.rejections = dict.fromkeys(REJECTION_RULES, 0)
+        # row index of each quake id, built the first time quakes are upserted
+        self.id_index = None
         # set filters to 0 as default
         self.location_filter = (0.0, 0.0, 0)
         self.property_filter = (0.0, 0, 0)
+        # (start, end) epoch ms, None for no limit
+        self.time_filter = (None, None)
+        # no spatial, time or property indexes until they are asked for
+        self.spatial_index = None
+        self.time_index = None
+        self.property_indexes = None
+        # the sorted indexes are only used when they cut the quakes to check down to this fraction or less
+        self.index_max_fraction = 0.05
+        # threads the filters are evaluated with, and the size of the blocks they split the quakes into
+        self.filter_workers = 1
+        self.filter_block_size = 1 << 18
+        self.filter_pool = None
+        # recently used filter masks, keyed by the filters that made them, most recent last
+        self.mask_cache = OrderedDict()
+        self.mask_cache_size = 8
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # (filters, rows, grid) of the filtered quakes the nearest quake queries search, built on the first one
+        self.nearest_grid = None
+        # magnitude statistics are only worked out the first time they are asked for
+        self.magnitude_stats = None
+        # the filters and result of the last get_magnitude_stats call
+        self.last_stats = (None, None)
+
+    @quake_profiler.timed('build.spatial_index')
+    def build_spatial_index(self, cell_size=1.0):
+        """This function is responsible for building the spatial index used by the location filter, so the
+            catalog only has to be bucketed once for any number of radius queries"""
+
+        self.spatial_index = SpatialIndex(self.quake_array['lat'], self.quake_array['long'], cell_size)
+        return self.spatial_index
+
+    def get_id_index(self):
+        """This function is responsible for returning the dict of quake key (see get_row_keys) to row index,
+            building it if needed"""
+
+        if self.id_index is None:
+            self.id_index = {key: i for i, key in enumerate(get_row_keys(self.quake_array))}
+
+        return self.id_index
+
+    def reserve(self, size):
+        """This function is responsible for making sure the quake array is writable and its buffer has room for
+            size rows, doubling the buffer when it has to grow"""
+
+        count = len(self.quake_array)
+        capacity = len(self.quake_buffer)
+
+        if size <= capacity and self.quake_buffer.flags.writeable:
+            return
+
+        # a new buffer is needed, either for room or because the current one is read only (memory-mapped)
+        capacity = max(size, capacity * 2, 16)
+        buffer = np.empty(capacity, dtype=self.quake_array.dtype)
+        buffer[:count] = self.quake_array
+
+        self.quake_buffer = buffer
+        self.quake_array = buffer[:count]
+
+    @quake_profiler.timed('upsert')
+    def upsert(self, rows):
+        """
+            This function is responsible for applying new and changed quakes to the catalog in place. Rows whose
+            id is already in the catalog replace that quake (if anything changed), and the rest are appended.
+            Rows without an id can only be matched by their whole content, so one that is already in the catalog
+            is skipped, but a changed one is appended as a new quake.
+            The spatial index, magnitude stats and cached masks are updated for just the changed rows, so the
+            cost grows with the number of changes rather than the size of the catalog.
+
+            Returns the number of (inserted, updated) quakes.
+        """
+
+        rows = np.asarray(rows, dtype=QUAKE_DTYPE)
+        id_index = self.get_id_index()
+
+        # if an id shows up more than once, the last row for it wins
+        keys = get_row_keys(rows)
+        latest = {key: i for i, key in enumerate(keys)}
+
+        new_rows = []
+        updated_rows = []
+        updated_at = []
+        for key, i in latest.items():
+            if key in id_index:
+                updated_rows.append(i)
+                updated_at.append(id_index[key])
+            else:
+                new_rows.append(i)
+
+        updated_rows = np.array(updated_rows, dtype=np.int64)
+        updated_at = np.array(updated_at, dtype=np.int64)
+        new_rows = np.sort(np.array(new_rows, dtype=np.int64))
+
+        # skip updates where nothing changed
+        changed = self.quake_array[updated_at] != rows[updated_rows]
+        updated_rows = updated_rows[changed]
+        updated_at = updated_at[changed]
+
+        if len(updated_rows) == 0 and len(new_rows) == 0:
+            return 0, 0
+
+        count = len(self.quake_array)
+        self.reserve(count + len(new_rows))
+        # the old values of the indexed columns, to take out of the indexes
+        old_columns = {column: self.quake_array[column][updated_at].copy() for column in INDEXED_COLUMNS}
+
+        # apply the changes
+        self.quake_array[updated_at] = rows[updated_rows]
+        self.quake_array = self.quake_buffer[:count + len(new_rows)]
+        self.quake_array[count:] = rows[new_rows]
+
+        inserted_at = np.arange(count, len(self.quake_array))
+        for i, row in zip(inserted_at.tolist(), new_rows.tolist()):
+            id_index[keys[row]] = i
+
+        self.update_derived(updated_at, old_columns, inserted_at)
+
+        return len(new_rows), len(updated_at)
+
+    def update_derived(self, updated_at, old_columns, inserted_at):
+        """This function is responsible for bringing everything built from the quake array up to date after
+            the rows at updated_at were changed and the rows at inserted_at were appended"""
+
+        changed = np.concatenate((updated_at, inserted_at))
+
+        # spatial index, rebuilt once too many quakes are waiting outside the grid
+        if self.spatial_index is not None:
+            self.spatial_index.update(self.quake_array['lat'], self.quake_array['long'], changed)
+            if len(self.spatial_index.extra) > max(1024, len(self.quake_array) // 16):
+                self.build_spatial_index(self.spatial_index.cell_size)
+
+        # sorted property indexes
+        if self.property_indexes is not None:
+            for column, index in self.property_indexes.items():
+                index.update(updated_at, old_columns[column], self.quake_array[column][updated_at])
+                index.add(self.quake_array[column][inserted_at], inserted_at)
+
+        # time index
+        if self.time_index is not None:
+            self.time_index.update(updated_at, old_columns['time'], self.quake_array['time'][updated_at])
+            self.time_index.add(self.quake_array['time'][inserted_at], inserted_at)
+
+        # the nearest quake grid is rebuilt on the next query
+        self.nearest_grid = None
+
+        # running magnitude stats
+        if self.magnitude_stats is not None:
+            self.magnitude_stats.update(updated_at, old_columns['magnitude'],
+                                        self.quake_array['magnitude'][updated_at])
+            self.magnitude_stats.add(self.quake_array['magnitude'][inserted_at], inserted_at)
+        self.last_stats = (None, None)
+
+        # cached masks only need the changed rows checked again
+        for key, old_mask in self.mask_cache.items():
+            mask = np.empty(len(self.quake_array), dtype=bool)
+            mask[:len(old_mask)] = old_mask
+            mask[changed] = self.compute_filtered_mask(changed, *key)
+            mask.flags.writeable = False
+            self.mask_cache[key] = mask
+
+    @quake_profiler.timed('build.property_indexes')
+    def build_property_indexes(self):
+        """This function is responsible for building a sorted index of each column the property filter checks,
+            so selective filters only have to look at the quakes that can match"""
+
+        self.property_indexes = {column: SortedIndex(self.quake_array[column], dtype=self.quake_array.dtype[column])
+                                 for column in PROPERTY_COLUMNS}
+        return self.property_indexes
+
+    def get_index_candidates(self, property_filter, time_filter):
+        """
+            This function is responsible for using the sorted indexes to find the quakes that pass the most
+            selective of the property thresholds (or the time window, if the time index is built), which is a
+            binary search per column and a slice of the winner.
+
+            Returns None if even the most selective one keeps more than index_max_fraction of the quakes, since
+            scanning the columns is faster than gathering that many rows.
+        """
+
+        ranges = [(index, index.get_range(threshold, None))
+                  for index, threshold in zip(self.property_indexes.values(), property_filter)]
+        if self.time_index is not None and time_filter != (None, None):
+            ranges.append((self.time_index, self.time_index.get_range(*time_filter)))
+
+        index, (first, last) = min(ranges, key=lambda item: item[1][1] - item[1][0])
+        if last - first > self.index_max_fraction * len(self.quake_array):
+            return None
+
+        quake_profiler.count('filter.index_lookups')
+        return index.order[first:last]
+
+    @quake_profiler.timed('build.time_index')
+    def build_time_index(self):
+        """This function is responsible for building the sorted index of the quake times, used for time window
+            lookups and counts"""
+
+        self.time_index = SortedIndex(self.quake_array['time'], dtype='int64')
+        return self.time_index
+
+    def get_time_window(self, start=None, end=None):
+        """This function is responsible for returning the rows of the quakes with start <= time < end, sorted
+            by time. It is a binary search in the time index, so only the quakes in the window are touched."""
+
+        if self.time_index is None:
+            self.build_time_index()
+
+        return self.quake_array[self.time_index.get_indices(to_epoch_ms(start), to_epoch_ms(end))]
+
+    def get_time_counts(self, bucket='day'):
+        """
+            This function is responsible for counting the filtered quakes in each time bucket, which can be
+            'hour', 'day' or a positive bucket size in ms (anything else raises ValueError). Returns (bucket
+            start times in epoch ms, counts), leaving out empty buckets.
+
+            Only the quakes inside the time filter are looked at, and they come out of the time index already
+            sorted, so the counts are just the lengths of the runs of equal buckets.
+        """
+
+        if isinstance(bucket, str) and bucket in TIME_BUCKETS:
+            width = TIME_BUCKETS[bucket]
+        elif isinstance(bucket, (int, np.integer)) and not isinstance(bucket, bool) and bucket > 0:
+            width = int(bucket)
+        else:
+            raise ValueError(f"Unknown time bucket: {bucket!r}")
+
+        if self.time_index is None:
+            self.build_time_index()
+
+        sorted_times, order = self.time_index.get_sorted()
+        first, last = self.time_index.get_range(*self.time_filter)
+
+        # the other filters
+        keep = self.get_filtered_mask()[order[first:last]]
+        buckets = sorted_times[first:last][keep] // width
+
+        if buckets.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        # where each run of equal buckets starts
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+        counts = np.diff(np.concatenate((starts, [buckets.size])))
+
+        return buckets[starts] * width, counts
+
+    @quake_profiler.timed('build.magnitude_stats')
+    def build_magnitude_stats(self):
+        """This function is responsible for building the running magnitude statistics of the whole catalog"""
 
-    def set_location_filter(self, latitude=0.0, longitude=0.0, distance=0):
+        self.magnitude_stats = MagnitudeStats(self.quake_array['magnitude'])
+        self.last_stats = (None, None)
+        return self.magnitude_stats
+
+    @quake_profiler.timed('stats')
+    def get_magnitude_stats(self):
+        """
+            This function is responsible for returning the count, mean, median, std. dev and mode of the
+            magnitudes of the filtered quakes.
+
+            With no filters the running statistics already have the answers, and the same filters as last time
+            give the same answers. Otherwise only the magnitudes of the filtered quakes are gathered and worked
+            through (the median with a partition rather than a sort), so past getting the filter mask (which is
+            cached, and comes from the sorted indexes for selective filters) the cost grows with the number of
+            quakes that meet the filters rather than the size of the catalog.
+        """
+
+        if self.magnitude_stats is None:
+            self.build_magnitude_stats()
+
+        # same filters as last time, so same answer
+        key = self.get_filter_key()
+        if self.last_stats[0] == key:
+            return dict(self.last_stats[1])
+
+        mask = self.get_filtered_mask()
+        rows = np.flatnonzero(mask)
+
+        # when nothing is filtered out, the running statistics already have the answers
+        if len(rows) == len(mask):
+            stats = self.magnitude_stats
+            result = {'count': stats.count, 'mean': float(stats.mean) if stats.count else float('nan'),
+                      'median': float(stats.get_quantile(0.5)), 'std_dev': stats.get_std_dev(),
+                      'mode': stats.get_mode()}
+        else:
+            result = summarise_magnitudes(self.quake_array['magnitude'][rows])
+        self.last_stats = (key, result)
+
+        return dict(result)
+
+    def get_exceptional_quakes(self):
+        """This function is responsible for returning the rows of the filtered quakes that have a magnitude
+            greater than or equal to one standard deviation above the median magnitude"""
+
+        stats = self.get_magnitude_stats()
+        threshold = stats['median'] + stats['std_dev']
+
+        # only the top of the sorted magnitudes can be over the threshold
+        sorted_mags, order = self.magnitude_stats.get_sorted()
+        above = order[np.searchsorted(sorted_mags, threshold, side='left'):]
+        above = np.sort(above[self.get_filtered_mask()[above]])
+
+        return self.quake_array[above]
+
+    @quake_profiler.timed('cluster')
+    def find_clusters(self, eps=50, min_samples=5):
+        """
+            This function is responsible for grouping the filtered quakes into hotspots the way DBSCAN does, with
+            quakes within eps km of min_samples others (counting themselves) at the core of a cluster. Returns the
+            cluster label of every row of the quake array (-1 for noise, and for quakes outside the filters),
+            and the count, max magnitude and centroid of each cluster.
+        """
+
+        rows = np.flatnonzero(self.get_filtered_mask())
+
+        labels = np.full(len(self.quake_array), -1, dtype=np.int64)
+        labels[rows] = cluster_points(self.quake_array['lat'][rows], self.quake_array['long'][rows], eps,
+                                      min_samples)
+
+        return labels, summarise_clusters(self.quake_array, labels)
+
+    @quake_profiler.timed('build.nearest_grid')
+    def build_nearest_grid(self, per_cell=4):
+        """This function is responsible for building the grid the nearest quake queries search, over the quakes
+            that meet the current filters, with cells sized to hold about per_cell quakes each"""
+
+        rows = np.flatnonzero(self.get_filtered_mask())
+        # each cell covers about cell_side^2 of the surface of the unit sphere, which has an area of 4 pi
+        cell_side = min(math.sqrt(4 * math.pi * per_cell / max(len(rows), 1)), 2.0)
+        grid = UnitVectorGrid(self.quake_array['lat'][rows], self.quake_array['long'][rows], cell_side)
+
+        self.nearest_grid = (self.get_filter_key(), rows, grid)
+
+    @quake_profiler.timed('nearest')
+    def find_nearest(self, latitudes, longitudes, k=1):
+        """
+            This function is responsible for finding the k quakes nearest to each of a batch of points, out of the
+            quakes that meet the current filters. Returns the rows of the quake array and the distances in km
+            (the same as calc_distance gives) as (points, k) arrays, nearest first, padded with -1 / inf if fewer
+            than k quakes meet the filters. k has to be at least 1. The grid is built on the first query and kept
+            until the filters or quakes change.
+        """
+
+        if isinstance(k, bool) or not isinstance(k, (int, np.integer)) or k < 1:
+            raise ValueError(f"k must be a whole number of at least 1, got {k!r}")
+
+        if self.nearest_grid is None or self.nearest_grid[0] != self.get_filter_key():
+            self.build_nearest_grid()
+        _, rows, grid = self.nearest_grid
+
+        lats = np.atleast_1d(np.asarray(latitudes, dtype='float64'))
+        longs = np.atleast_1d(np.asarray(longitudes, dtype='float64'))
+        nearest = grid.get_nearest(lats, longs, k)
+
+        found = nearest >= 0
+        quake_rows = np.full(nearest.shape, -1, dtype=np.int64)
+        quake_rows[found] = rows[nearest[found]]
+
+        points = np.broadcast_to(np.arange(len(lats))[:, None], nearest.shape)[found]
+        distances = np.full(nearest.shape, np.inf)
+        distances[found] = calc_distances(self.quake_array['lat'][quake_rows[found]],
+                                          self.quake_array['long'][quake_rows[found]], lats[points], longs[points])
+
+        return quake_rows, distances
+
+    def set_location_filter(self, latitude=0.0, longitude=0.0, distance=0, verbose=True):
         """This function is responsible for setting the Location Filter for the Quake Data obj"""
 
         self.location_filter = (latitude, longitude, distance)
 
-        msg = "Location filter has been updated --> "
-        msg += f"(Latitude: {latitude}, Longitude: {longitude}, Distance: {distance})"
-        print(msg)
+        if verbose:
+            msg = "Location filter has been updated --> "
+            msg += f"(Latitude: {latitude}, Longitude: {longitude}, Distance: {distance})"
+            print(msg)
 
-    def set_property_filter(self, magnitude=0.0, felt=0, significance=0):
+    def set_property_filter(self, magnitude=0.0, felt=0, significance=0, verbose=True):
         """This function is responsible for setting the Property Filter for the Quake Data obj"""
 
         if magnitude == 0.0 and felt == 0 and significance == 0:
@@ -136,15 +1015,41 @@ class QuakeData:
 
         self.property_filter = (magnitude, felt, significance)
 
-        msg = "Property filter has been updated -->  "
-        msg += f"(Magnitude: {magnitude}, Felt: {felt}, Significance: {significance})"
-        print(msg)
+        if verbose:
+            msg = "Property filter has been updated -->  "
+            msg += f"(Magnitude: {magnitude}, Felt: {felt}, Significance: {significance})"
+            print(msg)
+
+    def set_time_filter(self, start=None, end=None, verbose=True):
+        """This function is responsible for setting the Time Filter for the Quake Data obj, keeping quakes with
+            start <= time < end. The times can be epoch ms, datetimes or ISO strings, and None means no limit."""
+
+        start = to_epoch_ms(start)
+        end = to_epoch_ms(end)
+        if start is not None and end is not None and end < start:
+            raise ValueError("The end of the time filter can't be before the start")
+
+        self.time_filter = (start, end)
 
-    def clear_filters(self):
+        if verbose:
+            msg = "Time filter has been updated -->  "
+            msg += f"(Start: {start}, End: {end})"
+            print(msg)
+
+    def get_filter_key(self):
+        """This function is responsible for returning all the current filters as one hashable key"""
+
+        return self.location_filter, self.property_filter, self.time_filter
+
+    def clear_filters(self, verbose=True):
         """This function is responsible for resetting the Location Filter and Property Filter for the Quake Data obj"""
 
         self.location_filter = (0.0, 0.0, 0)
         self.property_filter = (0.0, 0, 0)
+        self.time_filter = (None, None)
+
+        if not verbose:
+            return
 
         # printout to display that filter reset was successful
         msg = "Location filter has been reset -->  "
@@ -155,46 +1060,156 @@ class QuakeData:
         msg += f"(Magnitude: {self.property_filter[0]}, "
         msg += f"Felt: {self.property_filter[1]}, "
         msg += f"Significance: {self.property_filter[2]})\n"
+        msg += "Time filter has been reset -->  (Start: None, End: None)\n"
         print(msg)
 
-    def get_filtered_array(self):
-        """This function is responsible for applying the Location/Property filters, and filtering the quakes
-            based on which quakes meet the specified criteria"""
+    def get_filtered_mask(self):
+        """This function is responsible for returning a mask of the quakes that meet the Location/Property
+            filters, reusing the mask from the cache if these filters were used recently. The mask is read only
+            since it can be shared between calls."""
+
+        key = self.get_filter_key()
+
+        if key in self.mask_cache:
+            self.cache_hits += 1
+            quake_profiler.count('mask_cache.hits')
+            # mark it as the most recently used
+            self.mask_cache.move_to_end(key)
+            return self.mask_cache[key]
+
+        self.cache_misses += 1
+        quake_profiler.count('mask_cache.misses')
+        mask = self.compute_filtered_mask()
+        mask.flags.writeable = False
+
+        self.mask_cache[key] = mask
+        # drop the least recently used masks once the cache is full
+        while len(self.mask_cache) > self.mask_cache_size:
+            self.mask_cache.popitem(last=False)
+
+        return mask
+
+    def clear_mask_cache(self):
+        """This function is responsible for emptying the mask cache and resetting its counters"""
+
+        self.mask_cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def get_cache_stats(self):
+        """This function is responsible for returning the hit/miss counters and size of the mask cache"""
+
+        return {'hits': self.cache_hits, 'misses': self.cache_misses, 'size': len(self.mask_cache),
+                'max_size': self.mask_cache_size}
+
+    @quake_profiler.timed('filter')
+    def compute_filtered_mask(self, rows=None, location_filter=None, property_filter=None, time_filter=None):
+        """This function is responsible for evaluating the Location/Property/Time filters (the current ones
+            unless others are given) as boolean masks over the columns of the quake array, returning a mask of
+            the quakes that meet the specified criteria. If rows are given, only those rows are checked."""
+
+        # variables for filter values
+        lat_f, long_f, dist_f = self.location_filter if location_filter is None else location_filter
+        mag_f, felt_f, sig_f = self.property_filter if property_filter is None else property_filter
+        start_f, end_f = self.time_filter if time_filter is None else time_filter
 
-        filtered_quakes = []
+        # a selective filter only needs the quakes the sorted indexes say can pass it checked
+        if rows is None and self.property_indexes is not None:
+            candidates = self.get_index_candidates((float(mag_f), int(felt_f), int(sig_f)), (start_f, end_f))
+            if candidates is not None:
+                mask = np.zeros(len(self.quake_array), dtype=bool)
+                mask[candidates] = self.compute_filtered_mask(candidates, (lat_f, long_f, dist_f),
+                                                              (mag_f, felt_f, sig_f), (start_f, end_f))
+                return mask
 
-        for quake in self.quake_array:
+        location_filter = (lat_f, long_f, dist_f)
+        property_filter = (mag_f, felt_f, sig_f)
+        time_filter = (start_f, end_f)
 
-            # isolate the Quake obj
-            q = quake[0]
+        # quakes outside the cells near the location are further than the distance, so they pass as they are
+        candidates = None
+        if rows is None and self.spatial_index is not None and int(dist_f) > 0:
+            candidates = self.spatial_index.get_candidates(float(lat_f), float(long_f), int(dist_f))
 
-            mag = float(q.mag)
-            sig = int(q.sig)
-            felt = int(q.felt)
+        if rows is None and self.filter_pool is not None and len(self.quake_array) > self.filter_block_size:
+            mask, distances_computed = self.compute_parallel_mask(location_filter, property_filter, time_filter,
+                                                                  candidates)
+        else:
+            quakes = self.quake_array if rows is None else self.quake_array[rows]
+            mask, distances_computed = evaluate_filters(quakes, location_filter, property_filter, time_filter,
+                                                        candidates)
 
-            # variables for filter values
-            lat_f, long_f, dist_f = self.location_filter
-            mag_f, felt_f, sig_f = self.property_filter
+        if quake_profiler.ENABLED:
+            quake_profiler.count('filter.evaluations')
+            quake_profiler.count('filter.rows_scanned', len(mask))
+            quake_profiler.count('filter.rows_returned', int(np.count_nonzero(mask)))
+            quake_profiler.count('filter.distances_computed', distances_computed)
 
-            # ensure each property is valid
-            if q.get_distance_from(float(lat_f), float(long_f)) >= int(dist_f):
-                if mag >= mag_f:
-                    if sig >= sig_f:
-                        if felt >= felt_f:
-                            filtered_quakes.append(q)
+        return mask
 
-        return filtered_quakes
+    def set_filter_workers(self, workers=None, block_size=None):
+        """
+            This function is responsible for setting how many threads the filters are evaluated with (None uses
+            one per cpu, and 1 turns the threads off). Catalogs bigger than block_size rows are split into blocks
+            of that many rows, which the threads work through at the same time. NumPy lets go of the GIL for the
+            comparisons and distance maths, so the blocks really do run in parallel.
+        """
+
+        if self.filter_pool is not None:
+            self.filter_pool.shutdown()
+            self.filter_pool = None
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.filter_workers = workers
+        if block_size is not None:
+            self.filter_block_size = block_size
+
+        if self.filter_workers > 1:
+            self.filter_pool = ThreadPoolExecutor(max_workers=self.filter_workers)
+
+    def compute_parallel_mask(self, location_filter, property_filter, time_filter, candidates=None):
+        """This function is responsible for evaluating the filters over contiguous blocks of the quake array in
+            the thread pool. Each block writes straight into its own part of the mask, so the blocks come out in
+            order without being merged."""
+
+        mask = np.empty(len(self.quake_array), dtype=bool)
+        starts = range(0, len(mask), self.filter_block_size)
+
+        # sorted, so each block can find its own candidates with a binary search
+        if candidates is not None:
+            candidates = np.sort(candidates)
+            bounds = np.searchsorted(candidates, list(starts) + [len(mask)])
+
+        def evaluate_block(i):
+            block = slice(starts[i], starts[i] + self.filter_block_size)
+            block_candidates = None if candidates is None else candidates[bounds[i]:bounds[i + 1]] - starts[i]
+            return evaluate_filters(self.quake_array[block], location_filter, property_filter, time_filter,
+                                    block_candidates, out=mask[block])[1]
+
+        distances_computed = sum(self.filter_pool.map(evaluate_block, range(len(starts))))
+
+        return mask, distances_computed
+
+    def get_filtered_array(self):
+        """This function is responsible for applying the Location/Property filters, and returning the rows of
+            the quake array for the quakes that meet the specified criteria"""
+
+        return self.quake_array[self.get_filtered_mask()]
 
     def get_filtered_list(self):
         """This function is responsible for returning a list of the filtered Quake objects"""
 
-        quake_list = [quake for quake in self.get_filtered_array()]
+        quake_list = make_quakes(self.get_filtered_array())
         return quake_list
 
 
 class Quake:
     """This class is for holding information pertaining to the valid earthquakes from the uploaded geojson filer"""
 
+    # Quakes are only made on demand from the quake array, so keep them small
+    __slots__ = ('mag', 'time', 'felt', 'sig', 'q_type', 'lat', 'long')
+
     def __init__(self, magnitude, time, felt, sig, q_type, coords):
         self.mag = magnitude
         self.time = time
@@ -208,5 +1223,11 @@ class Quake:
         return f"{self.mag} Magnitude Earthquake, {self.sig} Significance, felt by {self.felt} people in ({self.lat}, {self.long})"
 
     def get_distance_from(self, latitude, longitude):
-        """This function is responsible for returning the distance away it is from the passed in lat/long"""
-        return calc_distance(self.lat, self.long, latitude, longitude)
+        """This function is responsible for returning the distance away it is from the passed in lat/long,
+            which can also be arrays of lats/longs to get the distance to many points at once"""
+
+        # the scalar formula is quicker for a single point, numpy only pays off for arrays
+        if np.ndim(latitude) == 0 and np.ndim(longitude) == 0:
+            return calc_distance(self.lat, self.long, latitude, longitude)
+
+        return calc_distances(self.lat, self.long, latitude, longitude)
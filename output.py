@@ -1,12 +1,54 @@
 from pathlib import Path
-import random as randy
-
-path = Path('eq_output.geojson')
-
-
-# opens the file --> writes the text --> closes the file
-
-def get_start_data():
+import argparse
+import io
+import struct
+import numpy as np
+from earthquakes import QUAKE_DTYPE
+
+# the text of one feature, filled in with % (mag, time, felt, sig, id, id, title mag, lat, long, id)
+FEATURE_TEMPLATE = '''        {
+\t\t\t"type": "Feature",
+\t\t\t"properties": {
+\t\t\t\t"mag": %s,
+\t\t\t\t"place": "87 km ESE of Red Dog Mine, Alaska",
+\t\t\t\t"time": %d,
+\t\t\t\t"updated": 1715221508073,
+\t\t\t\t"tz": null,
+\t\t\t\t"url": "https://earthquake.usgs.gov/earthquakes/eventpage/%s",
+\t\t\t\t"detail": "https://earthquake.usgs.gov/earthquakes/feed/v1.0/detail/%s.geojson",
+\t\t\t\t"felt": %s,
+\t\t\t\t"cdi": null,
+\t\t\t\t"mmi": null,
+\t\t\t\t"alert": null,
+\t\t\t\t"status": "automatic",
+\t\t\t\t"tsunami": 0,
+\t\t\t\t"sig": %d,
+\t\t\t\t"net": "ak",
+\t\t\t\t"code": "0245z16lhr",
+\t\t\t\t"ids": ",ak0245z16lhr,",
+\t\t\t\t"sources": ",ak,",
+\t\t\t\t"types": ",origin,phase-data,",
+\t\t\t\t"nst": null,
+\t\t\t\t"dmin": null,
+\t\t\t\t"rms": 0.86,
+\t\t\t\t"gap": null,
+\t\t\t\t"magType": "ml",
+\t\t\t\t"type": "earthquake",
+\t\t\t\t"title": "M %.1f - 87 km ESE of Red Dog Mine, Alaska"
+\t\t\t},
+\t\t\t"geometry": {
+\t\t\t\t"type": "Point",
+\t\t\t\t"coordinates": [
+\t\t\t\t\t%.5f,
+\t\t\t\t\t%.5f,
+\t\t\t\t\t0.1
+\t\t\t\t]
+\t\t\t},
+\t\t\t"id": "%s"
+\t\t}'''
+
+
+def get_start_data(count):
     start_data = '{\n'
     start_data += '\t"type": "FeatureCollection",\n'
     start_data += '\t"metadata": {\n'
@@ -15,67 +57,15 @@ def get_start_data():
     start_data += '\t\t"title": "USGS All Earthquakes, Past Month",\n'
     start_data += '\t\t"status": 200,\n'
     start_data += '\t\t"api": "1.10.3",\n'
-    start_data += '\t\t"count": 10823\n'
+    start_data += f'\t\t"count": {count}\n'
     start_data += '\t},\n'
     start_data += '\t"features": [\n'
 
     return start_data
 
 
-def get_randy_feature():
-
-    mag = round(randy.random() + randy.randint(0, 10), 2)
-
-    if mag > 10:
-        mag = 10
-
-
-    text_to_write =  '        {\n'
-    text_to_write += '\t\t\t"type": "Feature",\n'
-    text_to_write += '\t\t\t"properties": {\n'
-    text_to_write += f'\t\t\t\t"mag": {mag},\n'
-    text_to_write += '\t\t\t\t"place": "87 km ESE of Red Dog Mine, Alaska",\n'
-    text_to_write += '\t\t\t\t"time": 1715221312431,\n'
-    text_to_write += '\t\t\t\t"updated": 1715221508073,\n'
-    text_to_write += '\t\t\t\t"tz": null,\n'
-    text_to_write += '\t\t\t\t"url": "https://earthquake.usgs.gov/earthquakes/eventpage/ak0245z16lhr",\n'
-    text_to_write += '\t\t\t\t"detail": "https://earthquake.usgs.gov/earthquakes/feed/v1.0/detail/ak0245z16lhr.geojson",\n'
-    text_to_write += f'\t\t\t\t"felt": {randy.randint(0, 10000)},\n'
-    text_to_write += '\t\t\t\t"cdi": null,\n'
-    text_to_write += '\t\t\t\t"mmi": null,\n'
-    text_to_write += '\t\t\t\t"alert": null,\n'
-    text_to_write += '\t\t\t\t"status": "automatic",\n'
-    text_to_write += '\t\t\t\t"tsunami": 0,\n'
-    text_to_write += f'\t\t\t\t"sig": {randy.randint(1, 5000)},\n'
-    text_to_write += '\t\t\t\t"net": "ak",\n'
-    text_to_write += '\t\t\t\t"code": "0245z16lhr",\n'
-    text_to_write += '\t\t\t\t"ids": ",ak0245z16lhr,",\n'
-    text_to_write += '\t\t\t\t"sources": ",ak,",\n'
-    text_to_write += '\t\t\t\t"types": ",origin,phase-data,",\n'
-    text_to_write += '\t\t\t\t"nst": null,\n'
-    text_to_write += '\t\t\t\t"dmin": null,\n'
-    text_to_write += '\t\t\t\t"rms": 0.86,\n'
-    text_to_write += '\t\t\t\t"gap": null,\n'
-    text_to_write += '\t\t\t\t"magType": "ml",\n'
-    text_to_write += '\t\t\t\t"type": "earthquake",\n'
-    text_to_write += '\t\t\t\t"title": "M 2.9 - 87 km ESE of Red Dog Mine, Alaska"\n'
-    text_to_write += '\t\t\t},\n'
-    text_to_write += '\t\t\t"geometry": {\n'
-    text_to_write += '\t\t\t\t"type": "Point",\n'
-    text_to_write += '\t\t\t\t"coordinates": [\n'
-    text_to_write += f'\t\t\t\t\t{round(randy.randint(-90, 90) + randy.random(), randy.randint(3,6))},\n'
-    text_to_write += f'\t\t\t\t\t{round(randy.randint(-180, 180) + randy.random(), randy.randint(3,6))},\n'
-    text_to_write += '\t\t\t\t\t0.1\n'
-    text_to_write += '\t\t\t\t]\n'
-    text_to_write += '\t\t\t},\n'
-    text_to_write += '\t\t\t"id": "ak0245z16lhr"\n'
-    text_to_write += '\t\t},\n'
-
-    return text_to_write
-
-
 def get_finisher():
-    finisher = '\t],\n'
+    finisher = '\n\t],\n'
     finisher += '\t"bbox": [\n'
     finisher += '\t\t-179.9934,\n'
     finisher += '\t\t-65.277,\n'
@@ -89,10 +79,149 @@ def get_finisher():
     return finisher
 
 
-output = get_start_data()
+def generate_batch(rng, start, size, mag_dist='uniform', b_value=1.0, invalid_fraction=0.0):
+    """
+        This function is responsible for generating the columns of size random quakes at once.
+
+        mag_dist 'uniform' spreads magnitudes evenly over 0-10 like the original generator, while
+        'gutenberg-richter' makes each whole magnitude about 10^b_value times rarer than the one below it,
+        like real catalogs. invalid_fraction of the quakes get a null felt value, so they fail validation.
+    """
+
+    if mag_dist == 'gutenberg-richter':
+        mags = rng.exponential(1 / (b_value * np.log(10)), size)
+    else:
+        mags = rng.uniform(0, 10, size)
+
+    return {
+        'mag': np.round(np.minimum(mags, 10), 2),
+        'time': 1715221312431 + (start + np.arange(size)) * 1000,
+        'felt': rng.integers(0, 10001, size),
+        'sig': rng.integers(1, 5001, size),
+        'lat': np.round(rng.uniform(-90, 90, size), 5),
+        'long': np.round(rng.uniform(-180, 180, size), 5),
+        'valid': rng.random(size) >= invalid_fraction,
+        'id': np.char.add('ak', np.char.zfill((start + np.arange(size)).astype(str), 10)),
+    }
+
+
+def format_features(batch):
+    """This function is responsible for turning a batch of generated quakes into the text of their features"""
+
+    felt = np.where(batch['valid'], batch['felt'].astype(str), 'null')
+    ids = batch['id'].tolist()
+
+    return ',\n'.join(FEATURE_TEMPLATE % (mag, time, quake_id, quake_id, quake_felt, sig, mag, lat, long, quake_id)
+                      for mag, time, quake_felt, sig, lat, long, quake_id
+                      in zip(batch['mag'].tolist(), batch['time'].tolist(), felt.tolist(), batch['sig'].tolist(),
+                             batch['lat'].tolist(), batch['long'].tolist(), ids))
+
+
+def to_quake_array(batch):
+    """This function is responsible for turning the valid quakes of a batch into rows of a quake array"""
+
+    valid = batch['valid']
+    quake_array = np.empty(int(valid.sum()), dtype=QUAKE_DTYPE)
+
+    quake_array['magnitude'] = batch['mag'][valid]
+    quake_array['felt'] = batch['felt'][valid]
+    quake_array['significance'] = batch['sig'][valid]
+    quake_array['lat'] = batch['lat'][valid]
+    quake_array['long'] = batch['long'][valid]
+    quake_array['time'] = batch['time'][valid]
+    quake_array['q_type'] = b'earthquake'
+    quake_array['id'] = np.char.encode(batch['id'][valid])
+
+    return quake_array
+
+
+def iter_batches(count, seed=0, batch_size=100000, **options):
+    """This function is responsible for generating count quakes batch_size at a time from a seeded RNG, so the
+        same seed always gives the same quakes"""
+
+    rng = np.random.default_rng(seed)
+    for start in range(0, count, batch_size):
+        yield generate_batch(rng, start, min(batch_size, count - start), **options)
+
+
+def write_geojson(path, count, seed=0, batch_size=100000, **options):
+    """This function is responsible for writing count random quakes to a geojson file, one batch at a time
+        through a buffered writer, so the file never has to fit in memory"""
+
+    with open(path, 'w', buffering=1 << 20) as file:
+        file.write(get_start_data(count))
+
+        # features are separated by commas, with none after the last one
+        separator = ''
+        for batch in iter_batches(count, seed, batch_size, **options):
+            file.write(separator)
+            file.write(format_features(batch))
+            separator = ',\n'
+
+        file.write(get_finisher())
+
+
+def get_npy_header(header, size=None):
+    """This function is responsible for returning the bytes of a version 1.0 .npy header, padded with spaces
+        out to size bytes if given, so a smaller shape can be written over a larger one"""
+
+    buffer = io.BytesIO()
+    np.lib.format.write_array_header_1_0(buffer, header)
+    data = buffer.getvalue()
+
+    if size is not None and len(data) < size:
+        # 6 magic bytes and 2 version bytes come before the little-endian header length
+        pad = size - len(data)
+        data = data[:8] + struct.pack('<H', len(data) - 10 + pad) + data[10:-1] + b' ' * pad + b'\n'
+
+    return data
+
+
+def write_npy(path, count, seed=0, batch_size=100000, **options):
+    """
+        This function is responsible for writing count random quakes straight to the columnar .npy format of
+        the quake array, skipping the geojson entirely. Like QuakeData, quakes that would fail validation are
+        left out. The rows are written a batch at a time after the header, which is rewritten with the final
+        row count at the end.
+    """
+
+    with open(path, 'wb', buffering=1 << 20) as file:
+        # write a header for the largest possible count, so the final one fits in the same space
+        header = {'descr': np.dtype(QUAKE_DTYPE).descr, 'fortran_order': False, 'shape': (count,)}
+        header_size = file.write(get_npy_header(header))
+
+        rows = 0
+        for batch in iter_batches(count, seed, batch_size, **options):
+            quake_array = to_quake_array(batch)
+            file.write(quake_array.tobytes())
+            rows += len(quake_array)
+
+        file.seek(0)
+        header['shape'] = (rows,)
+        file.write(get_npy_header(header, header_size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a random earthquake catalog for testing")
+    parser.add_argument('-o', '--output', default='eq_output.geojson',
+                        help="file to write, a .npy file writes the columnar quake array instead of geojson")
+    parser.add_argument('-n', '--count', type=int, default=1000, help="number of quakes to generate")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=100000)
+    parser.add_argument('--mag-dist', choices=['uniform', 'gutenberg-richter'], default='uniform')
+    parser.add_argument('--b-value', type=float, default=1.0, help="slope of the gutenberg-richter distribution")
+    parser.add_argument('--invalid-fraction', type=float, default=0.0,
+                        help="fraction of quakes given a null felt value")
+    args = parser.parse_args()
+
+    options = {'mag_dist': args.mag_dist, 'b_value': args.b_value, 'invalid_fraction': args.invalid_fraction}
+
+    path = Path(args.output)
+    if path.suffix == '.npy':
+        write_npy(path, args.count, args.seed, args.batch_size, **options)
+    else:
+        write_geojson(path, args.count, args.seed, args.batch_size, **options)
 
-for i in range(0, 1000):
-    output += get_randy_feature()
-output += get_finisher()
 
-path.write_text(output)
+if __name__ == '__main__':
+    main()
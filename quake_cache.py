@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import numpy as np
+from earthquakes import QuakeData, QUAKE_DTYPE, REJECTION_RULES
+import quake_profiler
+
+# name of the folder the caches are kept in, next to the geojson files they came from
+CACHE_DIR_NAME = '.quake_cache'
+# the quake array columns as they look once stored in the json metadata
+DTYPE_DESCR = json.loads(json.dumps(np.dtype(QUAKE_DTYPE).descr))
+# bump whenever parsing or validation changes which quakes are kept or how, so caches written before are rebuilt
+CACHE_VERSION = 2
+
+
+def hash_file(path, block_size=1 << 20):
+    """This function is responsible for returning the sha256 hex digest of a file, read a block at a time"""
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def get_cache_paths(path, cache_dir=None):
+    """This function is responsible for returning the (array, metadata) file paths of the cache for a source
+        file, named after a hash of its absolute path so different files never share a cache"""
+
+    path = os.path.abspath(path)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(path), CACHE_DIR_NAME)
+
+    name = hashlib.sha256(path.encode()).hexdigest()[:16]
+    base = os.path.join(cache_dir, f'{os.path.basename(path)}.{name}')
+
+    return base + '.npy', base + '.json'
+
+
+def get_source_key(path, with_hash=False):
+    """This function is responsible for returning the path, size and mtime (and optionally the content hash)
+        that the cache is checked against"""
+
+    stat = os.stat(path)
+    key = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        key['sha256'] = hash_file(path)
+
+    return key
+
+
+def save_cache(quake_array, path, cache_dir=None, key=None, rejections=None):
+    """This function is responsible for saving a quake array as the cache of the source file at path, along
+        with the number of features each validation rule rejected. The key should be taken before the file was
+        parsed, so changes made while parsing make the cache stale."""
+
+    array_path, meta_path = get_cache_paths(path, cache_dir)
+    os.makedirs(os.path.dirname(array_path), exist_ok=True)
+
+    meta = dict(get_source_key(path, with_hash=True) if key is None else key)
+    meta['dtype'] = DTYPE_DESCR
+    meta['version'] = CACHE_VERSION
+    meta['rules'] = list(REJECTION_RULES)
+    meta['rejections'] = dict.fromkeys(REJECTION_RULES, 0) if rejections is None else dict(rejections)
+
+    # write to temp files first, so a crash part way through never leaves a broken cache behind
+    with open(array_path + '.tmp', 'wb') as file:
+        np.save(file, np.ascontiguousarray(quake_array, dtype=QUAKE_DTYPE))
+    with open(meta_path + '.tmp', 'w') as file:
+        json.dump(meta, file)
+
+    os.replace(array_path + '.tmp', array_path)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def load_cache(path, cache_dir=None, verify_hash=False):
+    """
+        This function is responsible for memory-mapping the cached quake array of the source file at path,
+        returning it with the rejection counts saved alongside it, or None if there is no cache or it is out of
+        date.
+
+        The cache is out of date if it was written by another CACHE_VERSION or with other validation rules, or
+        if the path, size or mtime of the source have changed. If only the mtime changed but the content hash
+        still matches (the file was touched or copied), the cache is kept and its mtime updated. verify_hash=True
+        also hashes the source on every load, to catch edits that kept the same size and mtime.
+    """
+
+    array_path, meta_path = get_cache_paths(path, cache_dir)
+
+    try:
+        with open(meta_path, 'r') as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    key = get_source_key(path)
+    if meta.get('dtype') != DTYPE_DESCR or meta.get('version') != CACHE_VERSION:
+        return None
+    if meta.get('rules') != list(REJECTION_RULES):
+        return None
+    if meta['path'] != key['path'] or meta['size'] != key['size']:
+        return None
+
+    if meta['mtime_ns'] != key['mtime_ns'] or verify_hash:
+        if hash_file(path) != meta['sha256']:
+            return None
+        # same content, so just bring the stored mtime up to date
+        meta['mtime_ns'] = key['mtime_ns']
+        try:
+            with open(meta_path, 'w') as file:
+                json.dump(meta, file)
+        except OSError:
+            pass
+
+    try:
+        return np.load(array_path, mmap_mode='r'), meta['rejections']
+    except (OSError, ValueError):
+        return None
+
+
+def load_quake_data(path, cache_dir=None, verify_hash=False, chunk_size=10000):
+    """This function is responsible for creating a QuakeData obj for a geojson file, memory-mapping its cache
+        when there is an up to date one, and otherwise parsing the file and saving a cache for next time"""
+
+    with quake_profiler.timer('load.cache'):
+        cached = load_cache(path, cache_dir, verify_hash)
+
+    if cached is not None:
+        quake_profiler.count('load_cache.hits')
+        quake_data = QuakeData.from_array(cached[0])
+        quake_data.rejections.update(cached[1])
+        return quake_data
+
+    quake_profiler.count('load_cache.misses')
+
+    key = get_source_key(path, with_hash=True)
+    quake_data = QuakeData.from_path(path, chunk_size=chunk_size)
+
+    # a cache is only an optimisation, so don't fail the load if it can't be written
+    try:
+        with quake_profiler.timer('save.cache'):
+            save_cache(quake_data.quake_array, path, cache_dir, key, quake_data.rejections)
+    except OSError:
+        pass
+
+    return quake_data
@@ -0,0 +1,182 @@
+import csv
+import io
+import os
+import sys
+import numpy as np
+from earthquakes import QUAKE_DTYPE
+import quake_profiler
+
+try:
+    import pyarrow as pa
+except ImportError:
+    # arrow and parquet export are only available with pyarrow installed
+    pa = None
+
+# the quake array columns, in the order they are exported
+EXPORT_COLUMNS = [name for name, _ in QUAKE_DTYPE]
+
+# rows formatted and written at a time, big enough to keep the per chunk overhead small while the text of a chunk
+# stays a few MB
+EXPORT_CHUNK_SIZE = 65536
+
+# the text of one quake, the same as Quake.__str__
+QUAKE_LINE_TEMPLATE = '%s Magnitude Earthquake, %s Significance, felt by %s people in (%s, %s)\n'
+
+
+def get_columns(quake_array, mask=None):
+    """
+        This function is responsible for returning the columns of a quake array as separate contiguous arrays,
+        keeping only the rows in mask if given. The columns of a structured array are interleaved, so each one
+        is copied out once here (picking the masked rows is that copy), and everything after works on them
+        without copying again.
+    """
+
+    if mask is None:
+        return {name: np.ascontiguousarray(quake_array[name]) for name in EXPORT_COLUMNS}
+
+    return {name: quake_array[name][mask] for name in EXPORT_COLUMNS}
+
+
+def get_csv_template(columns):
+    """This function is responsible for returning the bytes % template of one csv row of the columns, with
+        floats written by repr so they read back exactly"""
+
+    formats = {'f': b'%r', 'i': b'%d', 'S': b'%s'}
+
+    return b','.join(formats[column.dtype.kind] for column in columns.values()) + b'\n'
+
+
+def needs_quoting(columns):
+    """This function is responsible for checking whether any of the text in the columns has to be quoted in a
+        csv file"""
+
+    for column in columns.values():
+        if column.dtype.kind == 'S' and len(column):
+            for char in (b',', b'"', b'\n', b'\r'):
+                if (np.char.find(column, char) >= 0).any():
+                    return True
+
+    return False
+
+
+def format_csv_rows(columns, template):
+    """This function is responsible for turning a chunk of columns into the bytes of their csv rows"""
+
+    if needs_quoting(columns):
+        # the csv module quotes the values that need it, which is slower but rare
+        buffer = io.StringIO()
+        values = [[value.decode() for value in column.tolist()] if column.dtype.kind == 'S' else column.tolist()
+                  for column in columns.values()]
+        csv.writer(buffer, lineterminator='\n').writerows(zip(*values))
+        return buffer.getvalue().encode()
+
+    return b''.join(map(template.__mod__, zip(*[column.tolist() for column in columns.values()])))
+
+
+@quake_profiler.timed('export.csv')
+def write_csv(columns, path, chunk_size=EXPORT_CHUNK_SIZE):
+    """This function is responsible for writing the columns to a csv file with a header row, formatting
+        chunk_size rows at a time into one block of text and writing it through a buffered file"""
+
+    template = get_csv_template(columns)
+    rows = len(next(iter(columns.values()))) if columns else 0
+
+    with open(path, 'wb', buffering=1 << 20) as file:
+        file.write(','.join(columns).encode() + b'\n')
+        for start in range(0, rows, chunk_size):
+            chunk = {name: column[start:start + chunk_size] for name, column in columns.items()}
+            file.write(format_csv_rows(chunk, template))
+
+    quake_profiler.count('export.rows', rows)
+
+
+def to_arrow_array(column):
+    """
+        This function is responsible for turning a column into an arrow array. Numbers are wrapped straight from
+        the numpy buffer without a copy, which is why the columns have to be contiguous. Fixed width strings
+        are padded with nul bytes in numpy, so they are packed into an arrow string buffer with offsets instead.
+    """
+
+    if column.dtype.kind == 'S':
+        lengths = np.char.str_len(column)
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int32)
+        data = b''.join(column.tolist())
+        return pa.Array.from_buffers(pa.string(), len(column), [None, pa.py_buffer(offsets), pa.py_buffer(data)])
+
+    return pa.Array.from_buffers(pa.from_numpy_dtype(column.dtype), len(column), [None, pa.py_buffer(column)])
+
+
+def to_arrow_table(columns):
+    """This function is responsible for turning the columns into an arrow table"""
+
+    if pa is None:
+        raise ImportError("pyarrow is needed to export arrow or parquet files")
+
+    return pa.Table.from_arrays([to_arrow_array(column) for column in columns.values()], names=list(columns))
+
+
+@quake_profiler.timed('export.arrow')
+def write_arrow(columns, path, chunk_size=None):
+    """This function is responsible for writing the columns to an arrow IPC (feather v2) file"""
+
+    table = to_arrow_table(columns)
+    with pa.OSFile(os.fspath(path), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=chunk_size)
+
+    quake_profiler.count('export.rows', table.num_rows)
+
+
+@quake_profiler.timed('export.parquet')
+def write_parquet(columns, path, chunk_size=None):
+    """This function is responsible for writing the columns to a parquet file, with chunk_size rows in each
+        row group"""
+
+    table = to_arrow_table(columns)
+    import pyarrow.parquet as pq
+    pq.write_table(table, os.fspath(path), row_group_size=chunk_size)
+
+    quake_profiler.count('export.rows', table.num_rows)
+
+
+# the writer for each export format, picked by the file extension unless the format is given
+EXPORT_FORMATS = {
+    'csv': write_csv,
+    'arrow': write_arrow,
+    'feather': write_arrow,
+    'parquet': write_parquet
+}
+
+
+def export_quakes(qd, path, export_format=None, chunk_size=None):
+    """
+        This function is responsible for writing the quakes that meet the current filters of a QuakeData obj to
+        a csv, arrow or parquet file, returning the number of quakes written. The format comes from the file
+        extension if it isn't given. Arrow and parquet need pyarrow.
+    """
+
+    if export_format is None:
+        export_format = os.path.splitext(os.fspath(path))[1].lstrip('.').lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format!r}, expected one of {', '.join(EXPORT_FORMATS)}")
+
+    columns = get_columns(qd.quake_array, qd.get_filtered_mask())
+    if chunk_size is None and export_format == 'csv':
+        chunk_size = EXPORT_CHUNK_SIZE
+    EXPORT_FORMATS[export_format](columns, path, chunk_size)
+
+    return len(columns['id'])
+
+
+def write_quake_lines(quake_array, out=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """This function is responsible for writing each quake the way print(quake) shows it, chunk_size quakes
+        at a time as one block of text rather than a print call per quake"""
+
+    if out is None:
+        out = sys.stdout
+
+    for start in range(0, len(quake_array), chunk_size):
+        chunk = quake_array[start:start + chunk_size]
+        out.write(''.join(map(QUAKE_LINE_TEMPLATE.__mod__, zip(
+            chunk['magnitude'].tolist(), chunk['significance'].tolist(), chunk['felt'].tolist(),
+            chunk['lat'].tolist(), chunk['long'].tolist()))))
@@ -0,0 +1,180 @@
+import asyncio
+import glob
+import inspect
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+import numpy as np
+from earthquakes import QuakeData, QUAKE_DTYPE, validate_features
+import quake_profiler
+
+
+def parse_feed(geojson):
+    """This function is responsible for validating the features of a feed the same way QuakeData does, and
+        returning the valid ones as rows of a quake array"""
+
+    return validate_features(geojson['features'])[0]
+
+
+def fetch_url(url, etag=None, last_modified=None, timeout=30):
+    """
+        This function is responsible for downloading a feed, asking the server to skip it if it hasn't changed
+        since the etag / last modified date of the last download.
+
+        Returns (body, etag, last_modified), with body None if the server said nothing has changed.
+    """
+
+    request = urllib.request.Request(url)
+    if etag:
+        request.add_header('If-None-Match', etag)
+    if last_modified:
+        request.add_header('If-Modified-Since', last_modified)
+
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.read(), response.headers.get('ETag'), response.headers.get('Last-Modified')
+    except urllib.error.HTTPError as error:
+        # 304 Not Modified
+        if error.code == 304:
+            return None, etag, last_modified
+        raise
+
+
+class FeedPoller:
+    """
+        This class keeps a QuakeData obj up to date with a live feed. The source can be the url of a geojson
+        feed like the USGS summary feeds, a local geojson file, or a folder of geojson files. Every poll only
+        fetches / reads what changed since the last one, then upserts the quakes by id, so only new and changed
+        quakes cost anything to apply. Quakes that drop out of the feed are kept.
+
+        A poll that fails (the server is down, a file is only half written, ...) is reported to on_error and
+        counted, and the next poll tries again, so one bad poll never stops the poller.
+    """
+
+    def __init__(self, source, quake_data=None, interval=60.0, on_update=None, on_error=None):
+
+        self.source = source
+        self.quake_data = quake_data if quake_data is not None else QuakeData.from_array(
+            np.empty(0, dtype=QUAKE_DTYPE))
+        self.interval = interval
+        # called with (inserted, updated) after each poll that changed something, can be async
+        self.on_update = on_update
+        # called with the exception of each failed fetch or file, printed to stderr if not given
+        self.on_error = on_error
+        self.errors = 0
+
+        # what was seen last time, so unchanged sources can be skipped
+        self.etag = None
+        self.last_modified = None
+        self.file_keys = {}
+
+    def is_url(self):
+        """This function is responsible for checking whether the source is a url rather than a local path"""
+
+        return str(self.source).startswith(('http://', 'https://'))
+
+    def report_error(self, error):
+        """This function is responsible for counting a failed fetch or file and passing it on to on_error"""
+
+        self.errors += 1
+        quake_profiler.count('feed.errors')
+
+        if self.on_error is not None:
+            self.on_error(error)
+        else:
+            print(f"Feed poll of {self.source} failed: {error}", file=sys.stderr)
+
+    def read_changed_files(self):
+        """This function is responsible for returning the quake arrays of the local files that are new or
+            changed since the last poll, in sorted path order. A file that can't be read is reported and left
+            to be tried again next poll."""
+
+        if os.path.isdir(self.source):
+            paths = sorted(glob.glob(os.path.join(self.source, '*.geojson')))
+        else:
+            paths = [self.source]
+
+        arrays = []
+        for path in paths:
+            stat = os.stat(path)
+            key = (stat.st_size, stat.st_mtime_ns)
+            if self.file_keys.get(path) == key:
+                continue
+            try:
+                arrays.append(QuakeData.from_path(path).quake_array)
+            except (OSError, ValueError) as error:
+                self.report_error(error)
+                continue
+            self.file_keys[path] = key
+
+        return arrays
+
+    async def poll_once(self):
+        """This function is responsible for checking the source once and applying any changes, returning the
+            number of (inserted, updated) quakes"""
+
+        try:
+            if self.is_url():
+                body, etag, last_modified = await asyncio.to_thread(
+                    fetch_url, self.source, self.etag, self.last_modified)
+                arrays = [] if body is None else [parse_feed(json.loads(body))]
+                # only remember the download once it parsed, so a bad one is fetched again
+                self.etag, self.last_modified = etag, last_modified
+            else:
+                arrays = await asyncio.to_thread(self.read_changed_files)
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            # http errors, timeouts and bad json, the next poll tries again
+            self.report_error(error)
+            arrays = []
+
+        inserted = updated = 0
+        for rows in arrays:
+            counts = self.quake_data.upsert(rows)
+            inserted += counts[0]
+            updated += counts[1]
+
+        quake_profiler.count('feed.polls')
+        quake_profiler.count('feed.inserted', inserted)
+        quake_profiler.count('feed.updated', updated)
+
+        if (inserted or updated) and self.on_update is not None:
+            result = self.on_update(inserted, updated)
+            if inspect.isawaitable(result):
+                await result
+
+        return inserted, updated
+
+    async def run(self, stop_event=None, max_polls=None):
+        """This function is responsible for polling every interval seconds until the stop event is set or
+            max_polls polls have been done"""
+
+        polls = 0
+        while stop_event is None or not stop_event.is_set():
+            await self.poll_once()
+            polls += 1
+            if max_polls is not None and polls >= max_polls:
+                break
+
+            # sleep for the interval, waking early if asked to stop
+            if stop_event is None:
+                await asyncio.sleep(self.interval)
+            else:
+                try:
+                    await asyncio.wait_for(stop_event.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+
+
+def watch_feed(source, interval=60.0, on_update=None, max_polls=None, on_error=None):
+    """This function is responsible for running a FeedPoller on the source until it is interrupted (or has done
+        max_polls polls), returning its QuakeData obj"""
+
+    poller = FeedPoller(source, interval=interval, on_update=on_update, on_error=on_error)
+    try:
+        asyncio.run(poller.run(max_polls=max_polls))
+    except KeyboardInterrupt:
+        pass
+
+    return poller.quake_data
@@ -0,0 +1,261 @@
+import math
+import numpy as np
+
+
+class SortedIndex:
+    """
+        This class keeps a sorted permutation of a column, so range and threshold lookups can be done with a
+        binary search (np.searchsorted) instead of a scan. Values can be added, removed and changed as the column
+        does, and new values are only merged into the sort when it is next used.
+    """
+
+    def __init__(self, values=None, dtype='float64'):
+
+        # the sorted values, and the index each of them was added at
+        self.sorted_values = np.empty(0, dtype=dtype)
+        self.order = np.empty(0, dtype=np.int64)
+        # (indices, values) batches not merged into the sort yet
+        self.pending = []
+        self.count = 0
+
+        if values is not None:
+            self.add(values)
+
+    def add(self, values, indices=None):
+        """This function is responsible for adding a batch of values to the index. They are given the next
+            indices in order unless their indices are passed in."""
+
+        values = np.array(values, dtype=self.sorted_values.dtype)
+        if values.size == 0:
+            return
+
+        if indices is None:
+            indices = np.arange(self.count, self.count + values.size)
+        self.pending.append((np.asarray(indices, dtype=np.int64), values))
+        self.count += values.size
+
+    def remove(self, values, indices):
+        """This function is responsible for taking a batch of values, previously added at the given indices,
+            back out of the index"""
+
+        values = np.asarray(values, dtype=self.sorted_values.dtype)
+        indices = np.asarray(indices, dtype=np.int64)
+        if indices.size == 0:
+            return
+
+        sorted_values, order = self.get_sorted()
+        if indices.size > 1024:
+            keep = ~np.isin(order, indices)
+            self.sorted_values = sorted_values[keep]
+            self.order = order[keep]
+        else:
+            # each one is somewhere in the run of equal values, found by binary search
+            firsts = np.searchsorted(sorted_values, values, side='left')
+            lasts = np.searchsorted(sorted_values, values, side='right')
+            positions = [first + int(np.flatnonzero(order[first:last] == index)[0])
+                         for first, last, index in zip(firsts.tolist(), lasts.tolist(), indices.tolist())]
+            self.sorted_values = np.delete(sorted_values, positions)
+            self.order = np.delete(order, positions)
+
+        self.count -= indices.size
+
+    def update(self, indices, old_values, new_values):
+        """This function is responsible for changing the values at the given indices"""
+
+        self.remove(old_values, indices)
+        self.add(new_values, indices)
+
+    def get_sorted(self):
+        """This function is responsible for merging any new values into the sort, and returning the sorted
+            values along with the index each of them was added at"""
+
+        if self.pending:
+            new_order = np.concatenate([indices for indices, _ in self.pending])
+            new_values = np.concatenate([values for _, values in self.pending])
+            self.pending = []
+
+            # sort the new values, then insert them into the sorted ones where they belong
+            new_sort = np.argsort(new_values, kind='stable')
+            positions = np.searchsorted(self.sorted_values, new_values[new_sort], side='right')
+            self.sorted_values = np.insert(self.sorted_values, positions, new_values[new_sort])
+            self.order = np.insert(self.order, positions, new_order[new_sort])
+
+        return self.sorted_values, self.order
+
+    def get_range(self, low=None, high=None):
+        """This function is responsible for returning the (first, last) positions in the sort of the values
+            with low <= value < high, where a low or high of None is open ended"""
+
+        sorted_values, _ = self.get_sorted()
+        first = 0 if low is None else self.search(low)
+        last = len(sorted_values) if high is None else self.search(high)
+
+        return first, max(first, last)
+
+    def search(self, value):
+        """This function is responsible for returning the position in the sort of the first value >= value"""
+
+        # numpy would otherwise convert all the sorted values to a common type first, e.g. an int32 column
+        # searched for a python int is copied to int64
+        if np.can_cast(np.min_scalar_type(value), self.sorted_values.dtype):
+            value = self.sorted_values.dtype.type(value)
+
+        return int(np.searchsorted(self.sorted_values, value, side='left'))
+
+    def get_indices(self, low=None, high=None):
+        """This function is responsible for returning the indices of the values with low <= value < high, in
+            order of value"""
+
+        first, last = self.get_range(low, high)
+        return self.order[first:last]
+
+
+class MagnitudeStats:
+    """
+        This class keeps running statistics of magnitudes as they are added, so they never have to be worked
+        out from scratch. The count, mean and variance are combined batch by batch (Welford's method), the
+        whole-number magnitudes are counted for the mode, and a sorted index of the magnitudes is kept for the
+        median and other quantiles.
+    """
+
+    def __init__(self, magnitudes=None):
+
+        self.count = 0
+        self.mean = 0.0
+        # sum of squared differences from the mean
+        self.m2 = 0.0
+        # number of magnitudes rounded down to each whole number
+        self.bucket_counts = {}
+        # sorted permutation of the magnitudes
+        self.sorted_index = SortedIndex()
+
+        if magnitudes is not None:
+            self.add(magnitudes)
+
+    def add(self, magnitudes, indices=None):
+        """This function is responsible for adding a batch of magnitudes to the running statistics. They are
+            given the next indices in order unless their indices are passed in."""
+
+        mags = np.array(magnitudes, dtype='float64')
+        if mags.size == 0:
+            return
+
+        # combine the mean and squared differences of the batch with the running ones
+        batch_count = mags.size
+        batch_mean = mags.mean()
+        batch_m2 = np.square(mags - batch_mean).sum()
+
+        total = self.count + batch_count
+        delta = batch_mean - self.mean
+        self.mean += delta * batch_count / total
+        self.m2 += batch_m2 + delta * delta * self.count * batch_count / total
+
+        self.add_buckets(mags, 1)
+        self.sorted_index.add(mags, indices)
+        self.count = total
+
+    def remove(self, magnitudes, indices):
+        """This function is responsible for taking a batch of magnitudes, previously added at the given
+            indices, back out of the running statistics"""
+
+        mags = np.array(magnitudes, dtype='float64')
+        if mags.size == 0:
+            return
+
+        # undo the combine in add
+        batch_count = mags.size
+        batch_mean = mags.mean()
+        batch_m2 = np.square(mags - batch_mean).sum()
+
+        remaining = self.count - batch_count
+        if remaining == 0:
+            self.mean = 0.0
+            self.m2 = 0.0
+        else:
+            mean = (self.mean * self.count - batch_mean * batch_count) / remaining
+            delta = batch_mean - mean
+            self.m2 = max(0.0, self.m2 - batch_m2 - delta * delta * remaining * batch_count / self.count)
+            self.mean = mean
+        self.count = remaining
+
+        self.add_buckets(mags, -1)
+        self.sorted_index.remove(mags, indices)
+
+    def update(self, indices, old_magnitudes, new_magnitudes):
+        """This function is responsible for changing the magnitudes at the given indices"""
+
+        self.remove(old_magnitudes, indices)
+        self.add(new_magnitudes, indices)
+
+    def add_buckets(self, mags, sign):
+        """This function is responsible for adding (sign 1) or taking away (sign -1) the magnitudes from the
+            counts of each whole-number magnitude"""
+
+        for bucket, count in zip(*count_floors(mags)):
+            self.bucket_counts[bucket] = self.bucket_counts.get(bucket, 0) + sign * count
+            if self.bucket_counts[bucket] == 0:
+                del self.bucket_counts[bucket]
+
+    def get_sorted(self):
+        """This function is responsible for returning the sorted magnitudes along with the index each of them
+            was added at"""
+
+        return self.sorted_index.get_sorted()
+
+    def get_std_dev(self):
+        """This function is responsible for returning the (population) standard deviation"""
+
+        if self.count == 0:
+            return float('nan')
+        return math.sqrt(self.m2 / self.count)
+
+    def get_mode(self):
+        """This function is responsible for returning the most common whole-number magnitude, the smallest
+            one if there is a tie"""
+
+        if not self.bucket_counts:
+            return None
+        return max(self.bucket_counts, key=lambda bucket: (self.bucket_counts[bucket], -bucket))
+
+    def get_quantile(self, q, mask=None):
+        """This function is responsible for returning the q quantile (0.5 for the median) of the magnitudes,
+            interpolating between neighbours like np.quantile. The mask picks which of the added magnitudes
+            to include, by the order they were added in."""
+
+        sorted_mags, order = self.get_sorted()
+        if mask is not None:
+            sorted_mags = sorted_mags[mask[order]]
+
+        if sorted_mags.size == 0:
+            return float('nan')
+
+        position = q * (sorted_mags.size - 1)
+        below = int(math.floor(position))
+        above = min(below + 1, sorted_mags.size - 1)
+
+        return sorted_mags[below] + (sorted_mags[above] - sorted_mags[below]) * (position - below)
+
+
+def summarise_magnitudes(mags):
+    """This function is responsible for working out the same statistics as MagnitudeStats straight from an
+        array of magnitudes, for a one off set of them that isn't worth keeping sorted"""
+
+    if mags.size == 0:
+        return {'count': 0, 'mean': float('nan'), 'median': float('nan'), 'std_dev': float('nan'), 'mode': None}
+
+    # the most common whole-number magnitude, the buckets are sorted so argmax picks the smallest on a tie
+    buckets, counts = count_floors(mags)
+    mode = buckets[int(np.argmax(counts))] if buckets else None
+
+    return {'count': int(mags.size), 'mean': float(mags.mean()), 'median': float(np.median(mags)),
+            'std_dev': float(mags.std()), 'mode': mode}
+
+
+def count_floors(mags):
+    """This function is responsible for counting the magnitudes rounded down to each whole number, returning
+        the whole numbers (in order) and their counts as lists. Only the whole numbers that occur are counted,
+        so a few far out magnitudes don't cost anything, and magnitudes that aren't finite are left out."""
+
+    floors, counts = np.unique(np.floor(mags[np.isfinite(mags)]), return_counts=True)
+
+    return [int(floor) for floor in floors.tolist()], counts.tolist()
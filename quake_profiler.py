@@ -0,0 +1,157 @@
+import atexit
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# set QUAKE_PROFILE=1 to collect timers and counters and print a summary at exit, or QUAKE_PROFILE=cprofile to
+# run cProfile as well. QUAKE_PROFILE_OUTPUT=<file> saves the cProfile stats there instead of printing them.
+ENV_VAR = 'QUAKE_PROFILE'
+OUTPUT_ENV_VAR = 'QUAKE_PROFILE_OUTPUT'
+
+# everything checks this first, so when profiling is off the cost is one attribute lookup
+ENABLED = False
+
+# total seconds and number of calls of each timed stage
+timers = defaultdict(float)
+timer_calls = defaultdict(int)
+# named counts, e.g. rows parsed or cache hits
+counters = defaultdict(int)
+
+profiler = None
+exit_registered = False
+
+
+def enable(use_cprofile=False, report_at_exit=True):
+    """This function is responsible for turning the instrumentation on, optionally with cProfile running too,
+        and printing the report when the program exits"""
+
+    global ENABLED, profiler, exit_registered
+
+    ENABLED = True
+
+    if use_cprofile and profiler is None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    if report_at_exit and not exit_registered:
+        atexit.register(dump_report)
+        exit_registered = True
+
+
+def disable():
+    """This function is responsible for turning the instrumentation (and cProfile) off, keeping what was
+        collected so far"""
+
+    global ENABLED
+
+    ENABLED = False
+    if profiler is not None:
+        profiler.disable()
+
+
+def reset():
+    """This function is responsible for clearing every timer and counter"""
+
+    timers.clear()
+    timer_calls.clear()
+    counters.clear()
+
+
+def count(name, amount=1):
+    """This function is responsible for adding amount to the named counter, if instrumentation is on"""
+
+    if ENABLED:
+        counters[name] += amount
+
+
+@contextmanager
+def timer(name):
+    """This function is responsible for timing the code in a with block as the named stage"""
+
+    if not ENABLED:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timers[name] += time.perf_counter() - start
+        timer_calls[name] += 1
+
+
+def timed(name):
+    """This function is responsible for making a decorator that times every call of a function as the named
+        stage"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timers[name] += time.perf_counter() - start
+                timer_calls[name] += 1
+
+        return wrapper
+
+    return decorator
+
+
+def get_report():
+    """This function is responsible for returning the timers and counters collected so far as a dict"""
+
+    return {
+        'timers': {name: {'seconds': timers[name], 'calls': timer_calls[name]} for name in sorted(timers)},
+        'counters': dict(sorted(counters.items())),
+    }
+
+
+def format_report():
+    """This function is responsible for building the summary of the timers and counters to show the user"""
+
+    report = "\n------------------ Quake Profile ------------------\n"
+    report += f"{'stage':<30}{'calls':>8}{'seconds':>12}\n"
+    for name in sorted(timers):
+        report += f"{name:<30}{timer_calls[name]:>8}{timers[name]:>12.4f}\n"
+
+    report += f"\n{'counter':<30}{'count':>20}\n"
+    for name in sorted(counters):
+        report += f"{name:<30}{counters[name]:>20}\n"
+    report += "---------------------------------------------------\n"
+
+    return report
+
+
+def dump_report(file=None):
+    """This function is responsible for writing the summary report, followed by the cProfile stats if cProfile
+        was running, to file (stderr by default)"""
+
+    file = sys.stderr if file is None else file
+    file.write(format_report())
+
+    if profiler is not None:
+        profiler.disable()
+        output = os.environ.get(OUTPUT_ENV_VAR)
+        if output:
+            profiler.dump_stats(output)
+            file.write(f"cProfile stats saved to {output}\n")
+        else:
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(30)
+            file.write(stream.getvalue())
+
+
+# turn on from the environment when this is first imported
+if os.environ.get(ENV_VAR, '').strip().lower() not in ('', '0', 'false', 'off'):
+    enable(use_cprofile=os.environ[ENV_VAR].strip().lower() == 'cprofile')
@@ -0,0 +1,580 @@
+import math
+from math import asin, sin, cos, radians
+import numpy as np
+
+
+# mean radius of the earth in km
+EARTH_RADIUS = 6371
+
+
+def calc_distances(lat1, long1, lat2, long2, out=None):
+    """
+        This function is the batched version of calc_distance. Any of the coordinates can be scalars or arrays,
+        and they broadcast against each other like a numpy ufunc, so one point against an array of points gives
+        one-to-many distances, and column/row arrays (lats[:, None] vs lats[None, :]) give many-to-many distances.
+
+        If out is given, the distances are written into it (it must already have the broadcast shape), so hot
+        loops can reuse the same buffer instead of allocating a new one each call.
+    """
+
+    # get the radian values of the coordinates
+    lat1_rad = np.radians(lat1)
+    lat2_rad = np.radians(lat2)
+    long1_rad = np.radians(long1)
+    long2_rad = np.radians(long2)
+
+    if out is None:
+        out = np.empty(np.broadcast_shapes(lat1_rad.shape, long1_rad.shape, lat2_rad.shape, long2_rad.shape))
+
+    # sin^2 of half the latitude difference, computed inside the output buffer
+    np.subtract(lat2_rad, lat1_rad, out=out)
+    out *= 0.5
+    np.sin(out, out=out)
+    np.square(out, out=out)
+
+    # plus cos(lat1) * cos(lat2) * sin^2 of half the longitude difference
+    half_delta_long = np.sin((long2_rad - long1_rad) * 0.5)
+    out += np.cos(lat1_rad) * np.cos(lat2_rad) * half_delta_long * half_delta_long
+
+    # rounding can push antipodal points a hair over 1, which arcsin can't handle
+    np.minimum(out, 1.0, out=out)
+    np.sqrt(out, out=out)
+    np.arcsin(out, out=out)
+    out *= 2 * EARTH_RADIUS
+
+    # hand back a plain scalar when every coordinate was a scalar
+    if out.ndim == 0:
+        return out[()]
+
+    return out
+
+
+def calc_distance_matrix(lats1, longs1, lats2, longs2, out=None, chunk_size=None):
+    """
+        This function is responsible for calculating the N x M matrix of distances between every point in
+        (lats1, longs1) and every point in (lats2, longs2).
+
+        With a chunk_size, the rows are worked through chunk_size at a time so the temporary arrays stay at
+        chunk_size x M instead of N x M. Use iter_distance_matrix if the whole matrix won't fit in memory.
+    """
+
+    lats1 = np.asarray(lats1, dtype='float64')
+    longs1 = np.asarray(longs1, dtype='float64')
+    lats2 = np.asarray(lats2, dtype='float64')
+    longs2 = np.asarray(longs2, dtype='float64')
+
+    if out is None:
+        out = np.empty((lats1.size, lats2.size), dtype='float64')
+
+    if chunk_size is None:
+        chunk_size = max(lats1.size, 1)
+
+    for start in range(0, lats1.size, chunk_size):
+        stop = start + chunk_size
+        calc_distances(lats1[start:stop, None], longs1[start:stop, None], lats2, longs2, out=out[start:stop])
+
+    return out
+
+
+def iter_distance_matrix(lats1, longs1, lats2, longs2, chunk_size=1024):
+    """
+        This function is responsible for walking through the N x M distance matrix chunk_size rows at a time,
+        yielding (row_start, block) pairs. The same block buffer is reused for every chunk, so peak memory is
+        capped at chunk_size x M no matter how large N gets - copy the block if it needs to be kept.
+    """
+
+    lats1 = np.asarray(lats1, dtype='float64')
+    longs1 = np.asarray(longs1, dtype='float64')
+    lats2 = np.asarray(lats2, dtype='float64')
+    longs2 = np.asarray(longs2, dtype='float64')
+
+    buffer = np.empty((chunk_size, lats2.size), dtype='float64')
+
+    for start in range(0, lats1.size, chunk_size):
+        stop = min(start + chunk_size, lats1.size)
+        block = buffer[:stop - start]
+        calc_distances(lats1[start:stop, None], longs1[start:stop, None], lats2, longs2, out=block)
+        yield start, block
+
+
+def normalise_coords(lats, longs):
+    """
+        This function is responsible for folding lat/long values back into [-90, 90] / [-180, 180]. The haversine
+        formula treats a latitude past a pole as the point on the other side of it, so this goes through the
+        3D unit vector to find that same point, meaning distances to the folded coordinates don't change.
+    """
+
+    x, y, z = to_unit_vectors(lats, longs).T
+
+    return to_coords(x, y, z)
+
+
+def to_unit_vectors(lats, longs):
+    """This function is responsible for turning lat/long values into 3D unit vectors from the centre of the
+        earth, as an (n, 3) array"""
+
+    lats_rad = np.radians(lats)
+    longs_rad = np.radians(longs)
+
+    return np.stack((np.cos(lats_rad) * np.cos(longs_rad), np.cos(lats_rad) * np.sin(longs_rad),
+                     np.sin(lats_rad)), axis=-1)
+
+
+def to_coords(x, y, z):
+    """This function is responsible for turning 3D vectors (of any length) back into lat/long values"""
+
+    return np.degrees(np.arctan2(z, np.hypot(x, y))), np.degrees(np.arctan2(y, x))
+
+
+def get_chord(distance):
+    """This function is responsible for returning the straight line distance between two unit vectors that are
+        distance km apart along the surface"""
+
+    return 2 * sin(min(distance / EARTH_RADIUS, math.pi) / 2)
+
+
+class SpatialIndex:
+    """
+        This class is a lat/long grid over a set of points, for answering radius queries without measuring the
+        distance to every point. Points are bucketed into cell_size degree cells and sorted by cell, so each row
+        of cells that a query touches is one or two contiguous slices of the sorted order.
+    """
+
+    def __init__(self, lats, longs, cell_size=1.0):
+
+        self.lats = np.asarray(lats, dtype='float64')
+        self.longs = np.asarray(longs, dtype='float64')
+        self.cell_size = float(cell_size)
+        self.n_rows = int(math.ceil(180 / self.cell_size))
+        self.n_cols = int(math.ceil(360 / self.cell_size))
+
+        # bucket the points by cell, folding any out of range coordinates first
+        norm_lats, norm_longs = normalise_coords(self.lats, self.longs)
+        rows = np.clip(((norm_lats + 90) // self.cell_size).astype(np.int64), 0, self.n_rows - 1)
+        cols = np.clip(((norm_longs + 180) // self.cell_size).astype(np.int64), 0, self.n_cols - 1)
+        cell_ids = rows * self.n_cols + cols
+
+        # point indices sorted by cell, and where each cell starts in that order
+        self.order = np.argsort(cell_ids, kind='stable')
+        counts = np.bincount(cell_ids, minlength=self.n_rows * self.n_cols)
+        self.cell_starts = np.concatenate(([0], np.cumsum(counts)))
+
+        # points added or moved since the grid was built, which every query checks
+        self.extra = np.empty(0, dtype=np.int64)
+
+    def update(self, lats, longs, changed):
+        """This function is responsible for updating the index after points were added or moved. The changed
+            indices aren't put into cells, they are just checked by every query until the index is rebuilt."""
+
+        self.lats = np.asarray(lats, dtype='float64')
+        self.longs = np.asarray(longs, dtype='float64')
+        self.extra = np.union1d(self.extra, np.asarray(changed, dtype=np.int64))
+
+    def get_col_ranges(self, longitude, delta_long):
+        """This function is responsible for returning the inclusive (first, last) column ranges covering
+            longitude +/- delta_long, split in two where they wrap around the antimeridian"""
+
+        west = longitude - delta_long
+        east = longitude + delta_long
+
+        if delta_long >= 180:
+            long_ranges = [(-180, 180)]
+        elif west < -180:
+            long_ranges = [(west + 360, 180), (-180, east)]
+        elif east > 180:
+            long_ranges = [(west, 180), (-180, east - 360)]
+        else:
+            long_ranges = [(west, east)]
+
+        col_ranges = []
+        for west, east in long_ranges:
+            first = max(0, int(math.floor((west + 180) / self.cell_size)))
+            last = min(self.n_cols - 1, int(math.floor((east + 180) / self.cell_size)))
+            col_ranges.append((first, last))
+
+        return col_ranges
+
+    def get_candidates(self, latitude, longitude, radius):
+        """This function is responsible for returning the indices of every point in a cell that could be within
+            radius km of the given point. Points that aren't returned are guaranteed to be further away."""
+
+        # angular radius, padded a little so rounding never drops a point right on the edge
+        theta = radius / EARTH_RADIUS + 1e-9
+        if theta >= math.pi:
+            return np.arange(len(self.lats))
+
+        lat, long = normalise_coords(float(latitude), float(longitude))
+        lat_rad = radians(lat)
+
+        # if the circle reaches over a pole, every longitude is in range for the rows around it
+        if lat_rad + theta >= math.pi / 2 or lat_rad - theta <= -math.pi / 2:
+            delta_long = 180
+        else:
+            delta_long = math.degrees(asin(min(1.0, sin(theta) / cos(lat_rad))))
+
+        first_row = max(0, int(math.floor((lat - math.degrees(theta) + 90) / self.cell_size)))
+        last_row = min(self.n_rows - 1, int(math.floor((lat + math.degrees(theta) + 90) / self.cell_size)))
+        col_ranges = self.get_col_ranges(long, delta_long)
+
+        slices = []
+        for row in range(first_row, last_row + 1):
+            for first_col, last_col in col_ranges:
+                start = self.cell_starts[row * self.n_cols + first_col]
+                stop = self.cell_starts[row * self.n_cols + last_col + 1]
+                if stop > start:
+                    slices.append(self.order[start:stop])
+
+        if len(self.extra):
+            slices.append(self.extra)
+
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+
+        return np.concatenate(slices)
+
+    def query_radius(self, latitude, longitude, radius):
+        """This function is responsible for returning the indices (in ascending order) and distances of
+            every point within radius km of the given point"""
+
+        # a moved point can be both in a cell and in the extra points
+        candidates = np.unique(self.get_candidates(latitude, longitude, radius))
+        distances = calc_distances(self.lats[candidates], self.longs[candidates], float(latitude), float(longitude))
+        within = distances <= radius
+
+        return candidates[within], distances[within]
+
+
+class UnitVectorGrid:
+    """
+        This class is a 3D grid over a set of points as unit vectors, for finding every pair of points that are
+        close together at once rather than one query at a time. The straight line (chord) distance between unit
+        vectors goes up with the distance along the surface, so a distance in km is just a chord length, and
+        unlike a lat/long grid there are no poles or antimeridian to handle.
+
+        The points are sorted by cell, with cell_side the side of each cell as a chord length, and only the
+        occupied cells are kept. Points are referred to by their position in that sorted order, so the points of
+        a cell sit next to each other in memory, and order maps the positions back to the original indices.
+    """
+
+    # the most cells along each side, so the key of every cell (size^3 of them) fits in an int64
+    MAX_SIZE = 1 << 20
+
+    def __init__(self, lats, longs, cell_side):
+
+        self.cell_side = float(cell_side)
+        # one empty cell of padding on each side, so stepping to a neighbouring cell never wraps around
+        if not 2 / self.MAX_SIZE * 1.01 < self.cell_side:
+            raise ValueError(f"Grid cell side must be more than {2 / self.MAX_SIZE * 1.01:.3g}, got {cell_side!r}")
+        self.size = int(math.ceil(2 / self.cell_side)) + 2
+
+        vectors = to_unit_vectors(np.asarray(lats, dtype='float64'), np.asarray(longs, dtype='float64'))
+
+        keys = self.get_keys(self.get_cell_coords(vectors))
+
+        # the points sorted by cell, and the key and start of each occupied cell in that order
+        self.order = np.argsort(keys, kind='stable')
+        self.vectors = vectors[self.order]
+        sorted_keys = keys[self.order]
+        firsts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))[:len(keys)])
+        self.cell_keys = sorted_keys[firsts]
+        self.cell_starts = np.concatenate((firsts, [len(keys)]))
+        self.cell_counts = np.diff(self.cell_starts)
+        # the cell at each position
+        self.point_cells = np.repeat(np.arange(len(self.cell_keys)), self.cell_counts)
+
+    def get_cell_coords(self, vectors):
+        """This function is responsible for returning the (x, y, z) cell each unit vector falls in"""
+
+        return np.clip(((vectors + 1) // self.cell_side).astype(np.int64) + 1, 1, self.size - 2)
+
+    def get_keys(self, coords):
+        """This function is responsible for turning (x, y, z) cells into the single number they are sorted by"""
+
+        return (coords[..., 0] * self.size + coords[..., 1]) * self.size + coords[..., 2]
+
+    def get_offsets(self, radius):
+        """
+            This function is responsible for returning the (dx, dy, dz) steps to the neighbouring cells that can
+            hold a point within radius (a chord length) of a point in the starting cell, sorted nearest first.
+            Only one of each +/- pair is returned, since a pair of cells only needs to be checked once, and the
+            starting cell itself isn't included.
+        """
+
+        reach = int(math.ceil(radius / self.cell_side))
+        steps = np.arange(-reach, reach + 1)
+        offsets = np.stack(np.meshgrid(steps, steps, steps, indexing='ij'), axis=-1).reshape(-1, 3)
+
+        # the first non-zero step is positive, so each +/- pair is only kept once
+        first = offsets[np.arange(len(offsets)), np.argmax(offsets != 0, axis=1)]
+        offsets = offsets[first > 0]
+
+        # the closest two points in the cells can be, which has to be within the radius
+        gaps = np.sqrt((np.maximum(np.abs(offsets) - 1, 0) ** 2).sum(axis=1)) * self.cell_side
+        offsets = offsets[gaps < radius]
+
+        return offsets[np.argsort(gaps[gaps < radius], kind='stable')]
+
+    def get_cell_pairs(self, offset):
+        """This function is responsible for returning the (first, second) indices of every pair of occupied cells
+            that are the given (dx, dy, dz) step apart"""
+
+        dx, dy, dz = (int(step) for step in offset)
+        targets = self.cell_keys + (dx * self.size + dy) * self.size + dz
+
+        # the targets are sorted too, so only the range of keys they span needs searching
+        low, high = np.searchsorted(self.cell_keys, [targets[0], targets[-1] + 1])
+        positions = np.searchsorted(self.cell_keys[low:high], targets) + low
+        found = positions < high
+        found[found] = self.cell_keys[positions[found]] == targets[found]
+
+        return np.flatnonzero(found), positions[found]
+
+    def iter_point_pairs(self, cells_a, cells_b, max_pairs=1 << 22):
+        """This function is responsible for yielding (i, j) arrays of positions for every pair of points with i
+            in one of cells_a and j in the matching one of cells_b, max_pairs pairs at a time"""
+
+        counts_b = self.cell_counts[cells_b]
+        offsets = np.concatenate(([0], np.cumsum(self.cell_counts[cells_a] * counts_b)))
+
+        for low in range(0, int(offsets[-1]), max_pairs):
+            high = min(low + max_pairs, int(offsets[-1]))
+
+            # the cell pairs this chunk covers, and how many of the pairs of each of them are in it
+            first = int(np.searchsorted(offsets, low, side='right')) - 1
+            last = int(np.searchsorted(offsets, high, side='left'))
+            bounds = np.clip(offsets[first:last + 1], low, high)
+            pairs = np.repeat(np.arange(first, last), np.diff(bounds))
+            within = np.arange(low, high) - offsets[pairs]
+
+            yield (self.cell_starts[cells_a[pairs]] + within // counts_b[pairs],
+                   self.cell_starts[cells_b[pairs]] + within % counts_b[pairs])
+
+    def get_shell(self, reach):
+        """This function is responsible for returning the (dx, dy, dz) steps to every cell exactly reach cells
+            away from the starting cell along at least one axis"""
+
+        steps = np.arange(-reach, reach + 1)
+        offsets = np.stack(np.meshgrid(steps, steps, steps, indexing='ij'), axis=-1).reshape(-1, 3)
+
+        return offsets[np.abs(offsets).max(axis=1) == reach]
+
+    def get_nearest(self, lats, longs, k=1, max_reach=8):
+        """
+            This function is responsible for returning the indices of the k points nearest to each query point
+            (nearest first), as a (queries, k) array padded with -1 if there are fewer than k points.
+
+            Every query searches out from its own cell one shell of cells at a time, all queries at once. Once
+            the shells up to reach cells away have been searched, every point not yet seen is at least reach cell
+            sides from the query, so a query is done when its kth nearest point is closer than that. The few
+            queries still going after max_reach shells (where the points are very sparse) check every point.
+        """
+
+        queries = to_unit_vectors(np.asarray(lats, dtype='float64'), np.asarray(longs, dtype='float64'))
+        query_coords = self.get_cell_coords(queries)
+        n_queries = len(queries)
+
+        # the k nearest positions found so far for each query, and their squared chord lengths
+        best = np.full((n_queries, k), -1, dtype=np.int64)
+        best_chords = np.full((n_queries, k), np.inf)
+        active = np.arange(n_queries)
+
+        for reach in range(max_reach + 1):
+            if not len(active) or not len(self.cell_keys):
+                break
+
+            # the occupied cells in this shell around each active query, skipping steps off the edge of the grid
+            coords = query_coords[active][:, None, :] + self.get_shell(reach)[None, :, :]
+            inside = ((coords >= 0) & (coords < self.size)).all(axis=2)
+            targets = self.get_keys(coords[inside])
+            owners = np.broadcast_to(active[:, None], inside.shape)[inside]
+            cells = np.minimum(np.searchsorted(self.cell_keys, targets), len(self.cell_keys) - 1)
+            found = self.cell_keys[cells] == targets
+            owners, cells = owners[found], cells[found]
+
+            # every point in those cells, tagged with the query it is a candidate for
+            counts = self.cell_counts[cells]
+            owners = np.repeat(owners, counts)
+            starts = np.repeat(self.cell_starts[cells] - np.cumsum(counts) + counts, counts)
+            positions = starts + np.arange(len(owners))
+            diff = self.vectors[positions] - queries[owners]
+            chords = np.einsum('ij,ij->i', diff, diff)
+
+            # keep the k nearest of the old best and the new candidates for each query
+            owners = np.concatenate((np.repeat(active, k), owners))
+            positions = np.concatenate((best[active].ravel(), positions))
+            chords = np.concatenate((best_chords[active].ravel(), chords))
+            order = np.lexsort((chords, owners))
+            owners, positions, chords = owners[order], positions[order], chords[order]
+            firsts = np.flatnonzero(np.concatenate(([True], owners[1:] != owners[:-1])))
+            ranks = np.arange(len(owners)) - np.repeat(firsts, np.diff(np.append(firsts, len(owners))))
+            keep = ranks < k
+            best[owners[keep], ranks[keep]] = positions[keep]
+            best_chords[owners[keep], ranks[keep]] = chords[keep]
+
+            active = active[best_chords[active, -1] > (reach * self.cell_side) ** 2]
+
+        # the queries that are still going check every point
+        for query in active:
+            diff = self.vectors - queries[query]
+            chords = np.einsum('ij,ij->i', diff, diff)
+            nearest = np.argsort(chords, kind='stable')[:k]
+            best[query, :len(nearest)] = nearest
+            best_chords[query, :len(nearest)] = chords[nearest]
+
+        # back from positions to the indices the points were given in
+        indices = np.full_like(best, -1)
+        found = best >= 0
+        indices[found] = self.order[best[found]]
+
+        return indices
+
+
+def union_pairs(parent, i, j):
+    """
+        This function is responsible for joining the sets that each pair of points (i[k], j[k]) are in. Every
+        point in parent points straight at the root of its set, which is the smallest point in it. Each round the
+        larger root of every pair still in different sets is hooked onto the smaller one, then the paths are
+        shortened by pointer jumping until every point points straight at its root again.
+    """
+
+    while len(i):
+        root_i = parent[i]
+        root_j = parent[j]
+        apart = root_i != root_j
+        if not apart.any():
+            return
+
+        i, j, root_i, root_j = i[apart], j[apart], root_i[apart], root_j[apart]
+        np.minimum.at(parent, np.maximum(root_i, root_j), np.minimum(root_i, root_j))
+
+        while True:
+            grandparents = parent[parent]
+            if np.array_equal(grandparents, parent):
+                break
+            parent[:] = grandparents
+
+
+def cluster_points(lats, longs, eps, min_samples=5, max_pairs=1 << 22):
+    """
+        This function is responsible for grouping points into clusters the way DBSCAN does, returning the cluster
+        label of each point, or -1 for noise. A point with at least min_samples points (counting itself) within
+        eps km is a core point, core points within eps of each other are in the same cluster, and the other
+        points join the cluster of a core point within eps of them, if there is one.
+
+        Rather than querying the neighbours of each point in turn, the points go in a UnitVectorGrid with cells
+        small enough that every pair of points in a cell is within eps, and the pairs of points in nearby cells
+        are all checked at once, cell pair by cell pair. Cells with at least min_samples points are all core
+        points already, so pairs between two of them are only checked to join their clusters, and not at all
+        once they have been joined.
+
+        eps has to be more than 0, and more than about 21 m so the grid doesn't get too fine for its cell keys.
+    """
+
+    if not eps > 0:
+        raise ValueError(f"eps must be more than 0 km, got {eps!r}")
+    # the cells below are eps / sqrt(3) across, and there can only be so many of them
+    min_chord = 2 / UnitVectorGrid.MAX_SIZE * 1.02 * math.sqrt(3)
+    if get_chord(eps) <= min_chord:
+        raise ValueError(f"eps must be more than {2 * EARTH_RADIUS * asin(min_chord / 2):.3f} km, got {eps!r}")
+
+    n = len(lats)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    chord = get_chord(eps)
+    # the diagonal of a cell is eps, so every pair of points in a cell is within eps of each other
+    grid = UnitVectorGrid(lats, longs, chord / math.sqrt(3) * (1 - 1e-9))
+    # everything below works on the positions of the points in the grid, not their indices
+    lats = np.asarray(lats, dtype='float64')[grid.order]
+    longs = np.asarray(longs, dtype='float64')[grid.order]
+    dense = grid.cell_counts >= min_samples
+    cell_pairs = [grid.get_cell_pairs(offset) for offset in grid.get_offsets(chord)]
+
+    def get_close(i, j):
+        # the chord length is a quick way to rule out most pairs, then the distance is measured like everywhere else
+        diff = grid.vectors[i] - grid.vectors[j]
+        close = np.einsum('ij,ij->i', diff, diff) <= (chord * (1 + 1e-9)) ** 2
+        close[close] = calc_distances(lats[i[close]], longs[i[close]], lats[j[close]], longs[j[close]]) <= eps
+        return i[close], j[close]
+
+    # the pairs of close points in different cells, unless both cells are dense
+    pairs = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))]
+    for cells_a, cells_b in cell_pairs:
+        sparse = ~(dense[cells_a] & dense[cells_b])
+        for i, j in grid.iter_point_pairs(cells_a[sparse], cells_b[sparse], max_pairs):
+            pairs.append(get_close(i, j))
+    pair_i = np.concatenate([i for i, _ in pairs])
+    pair_j = np.concatenate([j for _, j in pairs])
+
+    # the points within eps of each point, counting itself and everything else in its cell
+    neighbours = grid.cell_counts[grid.point_cells]
+    neighbours += np.bincount(pair_i, minlength=n) + np.bincount(pair_j, minlength=n)
+    core = neighbours >= min_samples
+
+    # join each core point to the first core point in its cell, then the close core points in other cells
+    parent = np.arange(n)
+    core_points = np.flatnonzero(core)
+    core_cells = grid.point_cells[core_points]
+    firsts = np.concatenate(([True], core_cells[1:] != core_cells[:-1]))[:len(core_points)]
+    union_pairs(parent, core_points[firsts][np.cumsum(firsts) - 1], core_points)
+    both = core[pair_i] & core[pair_j]
+    union_pairs(parent, pair_i[both], pair_j[both])
+
+    # dense cells near each other are joined if any of their points are close, nearest cells first
+    for cells_a, cells_b in cell_pairs:
+        pick = dense[cells_a] & dense[cells_b]
+        cells_a, cells_b = cells_a[pick], cells_b[pick]
+        apart = parent[grid.cell_starts[cells_a]] != parent[grid.cell_starts[cells_b]]
+        for i, j in grid.iter_point_pairs(cells_a[apart], cells_b[apart], max_pairs):
+            union_pairs(parent, *get_close(i, j))
+
+    # the other points take the smallest root of the core points they are close to, first those in their cell
+    roots = np.where(core, parent, n)
+    cell_roots = np.full(len(grid.cell_keys), n)
+    cell_roots[core_cells[firsts]] = parent[core_points[firsts]]
+    np.minimum(roots, cell_roots[grid.point_cells], out=roots)
+    border_i = ~core[pair_i] & core[pair_j]
+    np.minimum.at(roots, pair_i[border_i], parent[pair_j[border_i]])
+    border_j = core[pair_i] & ~core[pair_j]
+    np.minimum.at(roots, pair_j[border_j], parent[pair_i[border_j]])
+
+    # number the clusters, and put the labels back in the order the points were given
+    labels = np.full(n, -1, dtype=np.int64)
+    clustered = roots < n
+    labels[grid.order[clustered]] = np.unique(roots[clustered], return_inverse=True)[1]
+
+    return labels
+
+
+# the summary of each cluster found by QuakeData.find_clusters
+CLUSTER_DTYPE = [
+    ('cluster', 'int64'),
+    ('count', 'int64'),
+    ('max_magnitude', 'float64'),
+    ('lat', 'float64'),
+    ('long', 'float64')
+]
+
+
+def summarise_clusters(quake_array, labels):
+    """This function is responsible for returning the number of quakes, the largest magnitude, and the centroid
+        of each cluster, worked out from the average of the unit vectors so clusters over the antimeridian or a
+        pole come out right"""
+
+    clustered = labels >= 0
+    cluster_labels = labels[clustered]
+    n_clusters = int(cluster_labels.max()) + 1 if len(cluster_labels) else 0
+
+    summaries = np.empty(n_clusters, dtype=CLUSTER_DTYPE)
+    summaries['cluster'] = np.arange(n_clusters)
+    summaries['count'] = np.bincount(cluster_labels, minlength=n_clusters)
+
+    max_magnitudes = np.full(n_clusters, -np.inf)
+    np.maximum.at(max_magnitudes, cluster_labels, quake_array['magnitude'][clustered])
+    summaries['max_magnitude'] = max_magnitudes
+
+    vectors = to_unit_vectors(quake_array['lat'][clustered], quake_array['long'][clustered])
+    sums = [np.bincount(cluster_labels, weights=vectors[:, axis], minlength=n_clusters) for axis in range(3)]
+    summaries['lat'], summaries['long'] = to_coords(*sums)
+
+    return summaries
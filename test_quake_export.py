@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from earthquakes import QUAKE_DTYPE, QuakeData
+from quake_export import EXPORT_COLUMNS, export_quakes
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+def make_quake_data():
+    """This function is responsible for making a small catalog with text of different lengths, including
+        non-ascii text and empty ids"""
+
+    quake_array = np.zeros(6, dtype=QUAKE_DTYPE)
+    quake_array['magnitude'] = [1.5, 4.25, 6.0, 7.125, 2.0, 5.5]
+    quake_array['felt'] = [0, 12, 2147483647, 3, 4, -5]
+    quake_array['significance'] = [1, 2, 3, 4, 5, 6]
+    quake_array['lat'] = [52.1, -33.9, 0.0, 89.99999, -90.0, 12.34567]
+    quake_array['long'] = [-106.6, 151.2, 180.0, -180.0, 0.5, 98.76543]
+    quake_array['time'] = 1715221312431 + np.arange(6) * 1000
+    quake_array['q_type'] = [b'earthquake', b'quarry blast', b'explosion', b'earthquake', b'ice quake',
+                             'séisme'.encode()]
+    quake_array['id'] = [b'ak0245z16lhr', b'', b'us6000mxc2', 'idé'.encode(), b'x' * 24, b'nc1']
+
+    return QuakeData.from_array(quake_array)
+
+
+def assert_matches(table, quake_array):
+    """This function is responsible for checking an arrow table holds exactly the rows of a quake array"""
+
+    assert table.column_names == EXPORT_COLUMNS
+    assert table.num_rows == len(quake_array)
+
+    for name in EXPORT_COLUMNS:
+        column = table.column(name).to_pylist()
+        if quake_array.dtype[name].kind == 'S':
+            assert table.schema.field(name).type == pa.string()
+            assert column == [value.decode() for value in quake_array[name].tolist()]
+        else:
+            assert table.schema.field(name).type == pa.from_numpy_dtype(quake_array.dtype[name])
+            assert column == quake_array[name].tolist()
+
+
+@pytest.mark.parametrize('magnitude', [0.0, 5.0, 99.0])
+def test_arrow_round_trip(tmp_path, magnitude):
+    qd = make_quake_data()
+    if magnitude:
+        qd.set_property_filter(magnitude=magnitude, verbose=False)
+
+    path = tmp_path / 'quakes.arrow'
+    assert export_quakes(qd, path) == np.count_nonzero(qd.get_filtered_mask())
+
+    with pa.memory_map(str(path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+    assert_matches(table, qd.get_filtered_array())
+
+
+@pytest.mark.parametrize('magnitude', [0.0, 5.0, 99.0])
+def test_parquet_round_trip(tmp_path, magnitude):
+    qd = make_quake_data()
+    if magnitude:
+        qd.set_property_filter(magnitude=magnitude, verbose=False)
+
+    path = tmp_path / 'quakes.parquet'
+    export_quakes(qd, path, chunk_size=2)
+
+    assert_matches(pq.read_table(path), qd.get_filtered_array())
+
+
+def test_feather_extension_is_arrow(tmp_path):
+    qd = make_quake_data()
+    path = tmp_path / 'quakes.feather'
+    export_quakes(qd, path)
+
+    with pa.memory_map(str(path)) as source:
+        assert_matches(pa.ipc.open_file(source).read_all(), qd.get_filtered_array())
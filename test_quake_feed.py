@@ -0,0 +1,146 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from quake_feed import FeedPoller
+
+
+def make_feature(quake_id, mag=4.5):
+    """This function is responsible for making a valid geojson feature"""
+
+    return {'type': 'Feature', 'id': quake_id,
+            'properties': {'mag': mag, 'time': 1715221312431, 'felt': 3, 'sig': 300, 'type': 'earthquake'},
+            'geometry': {'type': 'Point', 'coordinates': [52.1, -106.6, 10.0]}}
+
+
+def make_feed(*features):
+    """This function is responsible for making the text of a geojson feed of the features"""
+
+    return json.dumps({'type': 'FeatureCollection', 'features': list(features)})
+
+
+class FeedServer:
+    """This class is a local stand-in for a feed server, serving whatever body / status it is set to, with the
+        body's etag so unchanged feeds get a 304"""
+
+    def __init__(self):
+
+        self.body = make_feed()
+        self.status = 200
+        self.requests = []
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                etag = f'"{hash(server.body)}"'
+                server.requests.append(self.headers.get('If-None-Match'))
+
+                if server.status != 200:
+                    self.send_error(server.status)
+                elif self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                else:
+                    data = server.body.encode()
+                    self.send_response(200)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}/feed.geojson'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def feed_server():
+    server = FeedServer()
+    yield server
+    server.close()
+
+
+def poll(poller):
+    return asyncio.run(poller.poll_once())
+
+
+def test_url_insert_update_not_modified_and_error(feed_server):
+    errors = []
+    poller = FeedPoller(feed_server.url, on_error=errors.append)
+
+    feed_server.body = make_feed(make_feature('a'), make_feature('b'))
+    assert poll(poller) == (2, 0)
+
+    # unchanged, so the server answers 304 and nothing is applied
+    assert poll(poller) == (0, 0)
+    assert feed_server.requests[-1] is not None
+
+    feed_server.body = make_feed(make_feature('a', mag=6.0), make_feature('c'))
+    assert poll(poller) == (1, 1)
+    magnitudes = dict(zip(poller.quake_data.quake_array['id'].tolist(),
+                          poller.quake_data.quake_array['magnitude'].tolist()))
+    assert magnitudes == {b'a': 6.0, b'b': 4.5, b'c': 4.5}
+
+    # a failed poll is reported, and the poller carries on once the server is back
+    feed_server.status = 404
+    assert poll(poller) == (0, 0)
+    assert len(errors) == 1 and poller.errors == 1
+
+    feed_server.status = 200
+    feed_server.body = make_feed(make_feature('d'))
+    assert poll(poller) == (1, 0)
+    assert len(poller.quake_data.quake_array) == 4
+
+
+def test_bad_json_is_fetched_again(feed_server):
+    errors = []
+    poller = FeedPoller(feed_server.url, on_error=errors.append)
+
+    feed_server.body = '{"type": "FeatureCollection", "features": ['
+    assert poll(poller) == (0, 0)
+    assert len(errors) == 1
+
+    # the etag of the bad body wasn't kept, so the fixed feed isn't skipped
+    feed_server.body = make_feed(make_feature('a'))
+    assert poll(poller) == (1, 0)
+
+
+def test_run_keeps_polling_after_errors(feed_server):
+    errors = []
+    feed_server.status = 500
+    poller = FeedPoller(feed_server.url, interval=0, on_error=errors.append)
+
+    asyncio.run(poller.run(max_polls=3))
+
+    assert len(errors) == 3
+    assert len(feed_server.requests) == 3
+
+
+def test_folder_of_files(tmp_path):
+    errors = []
+    poller = FeedPoller(str(tmp_path), on_error=errors.append)
+
+    (tmp_path / 'one.geojson').write_text(make_feed(make_feature('a'), make_feature('b')))
+    assert poll(poller) == (2, 0)
+    # nothing changed
+    assert poll(poller) == (0, 0)
+
+    # a half written file is reported and tried again next poll, the other files are still read
+    (tmp_path / 'two.geojson').write_text(make_feed(make_feature('c'))[:60])
+    (tmp_path / 'one.geojson').write_text(make_feed(make_feature('a', mag=7.0), make_feature('b')))
+    assert poll(poller) == (0, 1)
+    assert len(errors) == 1
+
+    (tmp_path / 'two.geojson').write_text(make_feed(make_feature('c')))
+    assert poll(poller) == (1, 0)
+    assert sorted(poller.quake_data.quake_array['id'].tolist()) == [b'a', b'b', b'c']
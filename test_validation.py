@@ -0,0 +1,97 @@
+import copy
+import random
+import numpy as np
+import pytest
+from earthquakes import QUAKE_DTYPE, REJECTION_RULES, get_quake_row, get_rejection, validate_features
+
+
+def make_feature(quake_id='ak0245z16lhr'):
+    """This function is responsible for making a valid geojson feature"""
+
+    return {'type': 'Feature', 'id': quake_id,
+            'properties': {'mag': 4.5, 'time': 1715221312431, 'felt': 3, 'sig': 300, 'type': 'earthquake'},
+            'geometry': {'type': 'Point', 'coordinates': [52.1, -106.6, 10.0]}}
+
+
+def set_path(feature, path, value):
+    """This function is responsible for setting (or with value ... deleting) a nested key of a feature"""
+
+    *parents, key = path
+    target = feature
+    for parent in parents:
+        target = target[parent]
+    if value is ...:
+        del target[key]
+    else:
+        target[key] = value
+    return feature
+
+
+# odd values for every field the rules look at, ... meaning the key is missing
+ODD_VALUES = {
+    ('type',): ['Feature', 'FeatureCollection', None, 1, ...],
+    ('id',): ['', None, 12, 1.5, [1, 2], [], {'a': 1}, 'x' * 24, 'x' * 25, 'é' * 12, 'é' * 12 + 'x', ...],
+    ('properties',): [None, [], 'text', ...],
+    ('properties', 'mag'): [0, -1e9, 1e300, 10 ** 400, float('nan'), float('inf'), True, '4.5', None, ...],
+    ('properties', 'time'): [0, -1, 2 ** 63 - 1, 2 ** 63, -2 ** 63, 1.5e18, 9.3e18, float('nan'), False, ...],
+    ('properties', 'felt'): [0, 2 ** 31 - 1, 2 ** 31, -2 ** 31, -2 ** 31 - 1, 3e9, 2147483647.5, None, '3', ...],
+    ('properties', 'sig'): [1, -5, 2 ** 40, 12.7, float('-inf'), [3], ...],
+    ('properties', 'type'): ['quarry blast', 't' * 32, 't' * 33, 'é' * 16, 'é' * 17, ['a', 'b'], 5, None, ...],
+    ('geometry',): [None, {}, 'point', ...],
+    ('geometry', 'type'): ['Point', 'LineString', None, ...],
+    ('geometry', 'coordinates'): [[1, 2, 3], [1.5, 2.5], [1, 2, 3, 4], (1, 2, 3), 'text', None, [None, 1, 2],
+                                  [float('nan'), 1, 2], [10 ** 400, 1, 2], [True, 1, 2], [1e20, -1e20, 0], ...],
+}
+
+
+def get_odd_features():
+    """This function is responsible for making a feature for every odd value of every field"""
+
+    features = [make_feature(), 'not a dict', None, []]
+    for path, values in ODD_VALUES.items():
+        for value in values:
+            features.append(set_path(make_feature(), path, copy.deepcopy(value)))
+    return features
+
+
+def check_validators_agree(features, chunk_size):
+    """This function is responsible for checking validate_features and the per-feature validator reject the
+        same features under the same rules, and store the same rows for the rest"""
+
+    quake_array, rejections = validate_features(features, chunk_size)
+
+    rules = [get_rejection(feature) for feature in features]
+    assert rejections == {rule: rules.count(rule) for rule in REJECTION_RULES}
+
+    rows = [get_quake_row(feature) for feature in features]
+    expected = np.array([row for row in rows if row is not None], dtype=QUAKE_DTYPE)
+    assert quake_array.tobytes() == expected.tobytes()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 10000])
+def test_odd_features(chunk_size):
+    check_validators_agree(get_odd_features(), chunk_size)
+
+
+def test_every_rule_is_covered():
+    rules = {get_rejection(feature) for feature in get_odd_features()}
+    assert rules == set(REJECTION_RULES) | {None}
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_mixes(seed):
+    # several odd values in one feature, so the order the rules are checked in matters too
+    rng = random.Random(seed)
+    paths = list(ODD_VALUES)
+    features = []
+    for _ in range(500):
+        feature = make_feature(f'id{rng.randrange(10 ** 6)}')
+        for path in rng.sample(paths, rng.randint(0, 3)):
+            try:
+                set_path(feature, path, copy.deepcopy(rng.choice(ODD_VALUES[path])))
+            except (KeyError, TypeError):
+                # the parent was already replaced by an odd value
+                pass
+        features.append(feature)
+
+    check_validators_agree(features, rng.choice([1, 13, 10000]))